@@ -1,29 +1,2917 @@
 import tkinter as tk
 from tkinter import ttk
-import pyautogui
-import pydirectinput
-import cv2
-import numpy as np
+import importlib
+import hashlib
 import platform
 import random
+import itertools
+import heapq
+import queue
 import threading
+import multiprocessing
+from multiprocessing import shared_memory
 import time
-from typing import Optional, Tuple
+import cProfile
+import pstats
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+import glob
+import argparse
+import csv
+import json
+import mmap
+import sqlite3
 import os
+import shutil
 import sys
+from collections import deque
+
+class StartupTimer:
+    """Milestones and import times from module load to a ready macro, for tracking startup regressions."""
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.marks: List[Tuple[str, float]] = [] # (milestone, seconds since origin)
+        self.durations: List[Tuple[str, float]] = [] # (step, seconds it took)
+
+    def mark(self, label):
+        self.marks.append((label, time.perf_counter() - self.origin))
+
+    def add(self, label, seconds):
+        self.durations.append((label, seconds))
+
+    def report(self) -> dict:
+        return {'marks': dict(self.marks), 'durations': dict(self.durations)}
+
+    def export(self, path):
+        """Print the report, or write it as JSON unless path is '-'."""
+        if path == '-':
+            for label, seconds in self.marks:
+                print(f"  {seconds * 1000:8.1f}ms  {label}")
+            for label, seconds in self.durations:
+                print(f"  {seconds * 1000:8.1f}ms  ({label})")
+            return
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=2)
+
+STARTUP = StartupTimer()
+
+class LazyModule:
+    """Stands in for a heavy module until first use, then imports it.
+
+    Keeps cv2, numpy and the input libraries off the path to the first
+    window; warm_up() imports them in the background. Once loaded, the
+    module-level name is rebound to the real module (or to None if an
+    optional import failed), so hot code pays nothing afterwards. Test an
+    optional module with truthiness, not `is None`, before it is loaded.
+    """
+    def __init__(self, name, alias, optional=False):
+        self._name = name
+        self._alias = alias # Global name to rebind
+        self._optional = optional
+        self._module = None
+        self._failed = False
+        self._lock = threading.Lock()
+
+    def _import(self):
+        with self._lock:
+            if self._module is None and not self._failed:
+                start = time.perf_counter()
+                try:
+                    self._module = importlib.import_module(self._name)
+                except Exception: # pyautogui raises more than ImportError without a display
+                    if not self._optional:
+                        raise
+                    self._failed = True
+                STARTUP.add(f"import {self._name}", time.perf_counter() - start)
+                globals()[self._alias] = self._module
+        if self._module is None:
+            raise ImportError(f"{self._name} is not available")
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._import(), attr)
+
+    def __bool__(self):
+        try:
+            self._import()
+        except ImportError:
+            return False
+        return True
+
+cv2 = LazyModule('cv2', 'cv2')
+np = LazyModule('numpy', 'np')
+pyautogui = LazyModule('pyautogui', 'pyautogui', optional=True) # Needs a display
+pydirectinput = LazyModule('pydirectinput', 'pydirectinput', optional=True) # Windows only
+mss = LazyModule('mss', 'mss', optional=True) # Fast screen grabber (XShm on Linux, BitBlt on Windows)
+
+def warm_up():
+    """Import the detection and input stacks, e.g. on a background thread before the first Start."""
+    for module in (np, cv2, mss, pyautogui):
+        if isinstance(module, LazyModule):
+            bool(module)
+    if platform.system() == "Windows" and isinstance(pydirectinput, LazyModule):
+        bool(pydirectinput)
 
 def resource_path(relative_path):
     """ Get absolute path to resource, works for dev and for PyInstaller """
     try:
-        # PyInstaller creates a temp folder and stores path in _MEIPASS
-        base_path = sys._MEIPASS
-    except Exception:
-        base_path = os.path.abspath(".")
+        # PyInstaller creates a temp folder and stores path in _MEIPASS
+        base_path = sys._MEIPASS
+    except Exception:
+        base_path = os.path.abspath(".")
+
+    return os.path.join(base_path, relative_path)
+
+# Glob pattern for each template group, relative to the assets folder
+TEMPLATE_GROUPS = {
+    'bobber': 'bobber*.png',
+    'bite': 'capture*.PNG',
+    'water': 'water*.png',
+}
+
+class Template:
+    """A decoded template image plus the terms the matcher needs."""
+    def __init__(self, name, image, gray=None, mean=None, norm=None):
+        self.name = name
+        self.image = image # BGR, as returned by cv2.imread
+        self.gray = gray if gray is not None else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        self.height, self.width = image.shape[:2]
+        self.size = (self.width, self.height)
+        # Zero-mean template and its norm, as used by TM_CCOEFF_NORMED (precomputed when loaded from a bundle)
+        self.mean = mean if mean is not None else image.reshape(-1, 3).mean(axis=0)
+        if norm is None:
+            centered = image.astype(np.float32) - self.mean.astype(np.float32)
+            norm = float(np.sqrt((centered * centered).sum()))
+        self.norm = norm
+        self._variants = {(1.0, False): self.image, (1.0, True): self.gray}
+        self._spectra = {}
+
+    def variant(self, scale=1.0, gray=False):
+        """The template resized by scale, in grayscale or BGR (cached)."""
+        key = (scale, gray)
+        image = self._variants.get(key)
+        if image is None:
+            source = self.gray if gray else self.image
+            size = (max(1, int(round(self.width * scale))), max(1, int(round(self.height * scale))))
+            image = self._variants[key] = cv2.resize(source, size, interpolation=cv2.INTER_AREA)
+        return image
+
+    def spectrum(self, shape, gray=False):
+        """Conjugate spectrum of the zero-mean template zero-padded to shape, and its norm (cached)."""
+        key = (shape, gray)
+        cached = self._spectra.get(key)
+        if cached is None:
+            image = self.variant(1.0, gray).astype(np.float64)
+            if image.ndim == 2:
+                image = image[..., None]
+            centered = image - image.reshape(-1, image.shape[2]).mean(axis=0)
+            if len(self._spectra) > 8:
+                self._spectra.clear() # Region size changed
+            cached = self._spectra[key] = (np.conj(np.fft.rfft2(centered, s=shape, axes=(0, 1))),
+                                           float(np.sqrt((centered * centered).sum())))
+        return cached
+
+class MatchConfig:
+    """How one template group is matched, and the thresholds its scores are judged by.
+
+    fft scores every full-resolution template from one spectrum of the frame.
+    A calibration can limit a group to some templates and give each its own
+    threshold, applied as an offset to its score (see apply_calibration).
+    With scale < 1 matching is coarse-to-fine: candidates are found on a
+    downscaled (by default grayscale) copy of the frame and only those spots
+    are confirmed at full resolution. gray runs the full-resolution stage in
+    grayscale, which scores differently from colour and needs its own
+    thresholds.
+    """
+    MIN_COARSE_SIZE = 8 # Templates smaller than this after scaling skip the coarse stage
+
+    def __init__(self, thresholds, scale=1.0, gray=False, coarse_gray=True, coarse_confidence=0.5, candidates=3,
+                 prefilter=False, fft=False):
+        self.thresholds = dict(thresholds)
+        self.fft = fft # Full-resolution stage through FFTCorrelator instead of one matchTemplate per template
+        self.templates: Optional[set] = None # Names of the templates to match; None for all
+        self.offsets: Dict[str, float] = {} # Added to a template's score before it is judged
+        self.prefilter = prefilter # Run the ColorPrefilter first and match only inside its candidate boxes
+        self.scale = scale
+        self.gray = gray
+        self.coarse_gray = coarse_gray
+        self.coarse_confidence = coarse_confidence
+        self.candidates = candidates
+
+    def threshold(self, name='found'):
+        return self.thresholds[name]
+
+    def uses(self, template):
+        return self.templates is None or template.name in self.templates
+
+    def coarse(self, template):
+        """True if template should go through the downscaled stage first."""
+        return self.scale < 1.0 and min(template.size) * self.scale >= self.MIN_COARSE_SIZE
+
+# Confidence thresholds, tuned on full-colour matching:
+#   bobber 'found' after a cast, 'present' while waiting for a bite,
+#   water while a paused spot is checked, after bobber misses ('after_miss') or after it disappeared ('after_loss')
+COLOUR_THRESHOLDS = {
+    'bobber': {'found': 0.8, 'present': 0.7},
+    'bite': {'found': 0.8},
+    'water': {'after_miss': 0.2, 'after_loss': 0.5},
+}
+# Grayscale scores run higher on non-matches; starting points until calibrated
+GRAY_THRESHOLDS = {
+    'bobber': {'found': 0.85, 'present': 0.75},
+    'bite': {'found': 0.85},
+    'water': {'after_miss': 0.3, 'after_loss': 0.6},
+}
+MATCH_MODES = ('full', 'pyramid', 'gray', 'fft')
+
+# Groups whose sprites have colours the water does not, so the colour prefilter can vouch for them
+PREFILTER_GROUPS = ('bite', 'bobber')
+
+def match_configs(mode='full', prefilter=False, calibration=None) -> Dict[str, 'MatchConfig']:
+    """Per-group matcher settings for a matching mode.
+
+    full:    full-resolution colour, as the macro always did
+    pyramid: half-scale grayscale search, confirmed in colour at full resolution
+    gray:    full-resolution grayscale
+    fft:     full-resolution colour through FFTCorrelator (same scores as full)
+    prefilter enables the colour prefilter for the PREFILTER_GROUPS.
+    calibration is a dict written by the calibrate command (see apply_calibration).
+    """
+    if mode == 'pyramid':
+        configs = {group: MatchConfig(COLOUR_THRESHOLDS[group], scale=0.5) for group in COLOUR_THRESHOLDS}
+    elif mode == 'fft':
+        configs = {group: MatchConfig(COLOUR_THRESHOLDS[group], fft=True) for group in COLOUR_THRESHOLDS}
+    elif mode == 'gray':
+        configs = {group: MatchConfig(GRAY_THRESHOLDS[group], gray=True) for group in GRAY_THRESHOLDS}
+    else:
+        configs = {group: MatchConfig(COLOUR_THRESHOLDS[group]) for group in COLOUR_THRESHOLDS}
+    for group in PREFILTER_GROUPS:
+        configs[group].prefilter = prefilter
+    if calibration is not None:
+        apply_calibration(configs, calibration, mode)
+    return configs
+
+TEMPLATE_BUNDLE = os.path.join('cache', 'templates.npz') # Preprocessed templates, rebuilt when assets change
+CALIBRATION_FILE = 'calibration.json' # Loaded from the working directory when present
+
+def load_calibration(path=None) -> Optional[dict]:
+    """Read a calibration written by the calibrate command; None if there is none."""
+    if path is None:
+        if not os.path.exists(CALIBRATION_FILE):
+            return None
+        path = CALIBRATION_FILE
+    try:
+        with open(path) as f:
+            calibration = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Error loading calibration {path}: {e}")
+        return None
+    print(f"Loaded calibration from {path}")
+    return calibration
+
+def apply_calibration(configs, calibration, mode):
+    """Limit calibrated groups to their chosen templates and judge each by its own threshold.
+
+    A template's threshold becomes an offset to its score, so the group's
+    named thresholds keep their meaning: a score just above the template's
+    own threshold counts as 'found', and 'present' keeps its margin below
+    unless the calibration measured its own.
+    """
+    if calibration.get('match_mode') != mode:
+        print(f"Calibration was made for match mode '{calibration.get('match_mode')}', not '{mode}'; ignoring it")
+        return
+    for group, entry in calibration.get('groups', {}).items():
+        config = configs.get(group)
+        if config is None or 'found' not in config.thresholds or not entry.get('thresholds'):
+            continue
+        found = config.threshold('found')
+        config.templates = set(entry['thresholds'])
+        config.offsets = {name: found - threshold for name, threshold in entry['thresholds'].items()}
+        if 'present' in entry and 'present' in config.thresholds:
+            config.thresholds['present'] = min(entry['present'], found)
+
+class ColorPrefilter:
+    """Vectorised colour lookup that finds pixels which could belong to a template group.
+
+    Colours are quantised into HSV bins. A bin counts as plausible when it is
+    common in the group's templates but (almost) absent from the background
+    (water) templates, so the filter keys on what makes a sprite stand out
+    rather than on the water around it. scan() returns the number of
+    plausible pixels and bounding boxes around them.
+    """
+    H_BIN = 6 # 180 hues -> 30 bins
+    SV_SHIFT = 5 # 256 levels -> 8 bins
+    BINS = (180 // H_BIN) * (256 >> SV_SHIFT) ** 2
+
+    def __init__(self, lut, min_pixels, max_boxes=8):
+        self.lut = lut # Bool per HSV bin
+        self.min_pixels = min_pixels # Fewer plausible pixels than this means no template can be present
+        self.max_boxes = max_boxes
+        self._hsv = None
+        self._kernel = np.ones((5, 5), np.uint8)
+
+    @classmethod
+    def bin_index(cls, hsv):
+        """HSV bin index for every pixel of an HSV image."""
+        h, s, v = hsv[..., 0], hsv[..., 1], hsv[..., 2]
+        return (h // cls.H_BIN).astype(np.intp) * 64 + (s >> cls.SV_SHIFT) * 8 + (v >> cls.SV_SHIFT)
+
+    @classmethod
+    def from_templates(cls, templates, background, min_share=0.002, max_background=0.002):
+        """Derive the plausible colours of templates against background templates.
+
+        Returns None if some template has no distinctive colour at all, since
+        the filter could then reject frames that contain it.
+        """
+        if not templates or not background:
+            return None
+        def histogram(images):
+            idx = np.concatenate([cls.bin_index(cv2.cvtColor(t.image, cv2.COLOR_BGR2HSV)).ravel() for t in images])
+            return np.bincount(idx, minlength=cls.BINS) / len(idx)
+        lut = (histogram(templates) >= min_share) & (histogram(background) <= max_background)
+        counts = [int(lut[cls.bin_index(cv2.cvtColor(t.image, cv2.COLOR_BGR2HSV))].sum()) for t in templates]
+        if min(counts) == 0:
+            return None
+        # Allow for partial occlusion and colour drift on screen
+        return cls(lut, min_pixels=max(1, min(counts) // 4))
+
+    def scan(self, frame, pad=(0, 0)):
+        """Return (plausible pixel count, boxes (x0, y0, x1, y1) padded by pad=(w, h)).
+
+        boxes is None when there are too many separate blobs to be worth
+        matching them one by one.
+        """
+        if self._hsv is None or self._hsv.shape != frame.shape:
+            self._hsv = np.empty_like(frame)
+        cv2.cvtColor(frame, cv2.COLOR_BGR2HSV, dst=self._hsv)
+        mask = self.lut[self.bin_index(self._hsv)].view(np.uint8)
+        count = int(cv2.countNonZero(mask))
+        if count < self.min_pixels:
+            return count, []
+        mask = cv2.dilate(mask, self._kernel)
+        n, _, stats, _ = cv2.connectedComponentsWithStats(mask)
+        height, width = frame.shape[:2]
+        boxes = []
+        for x, y, w, h, _ in stats[1:]:
+            box = [max(0, x - pad[0]), max(0, y - pad[1]), min(width, x + w + pad[0]), min(height, y + h + pad[1])]
+            # Merge into an overlapping box, if any
+            for other in boxes:
+                if box[0] < other[2] and other[0] < box[2] and box[1] < other[3] and other[1] < box[3]:
+                    other[:] = [min(box[0], other[0]), min(box[1], other[1]), max(box[2], other[2]), max(box[3], other[3])]
+                    break
+            else:
+                boxes.append(box)
+        if len(boxes) > self.max_boxes:
+            return count, None
+        return count, [tuple(int(v) for v in b) for b in boxes]
+
+class FFTCorrelator:
+    """TM_CCOEFF_NORMED for many templates from one spectrum of the image.
+
+    The image is transformed once; each template then costs one spectrum
+    product and one inverse FFT, using its cached spectrum padded to the same
+    size. As in OpenCV, the numerator is summed over channels of the
+    zero-mean template, and the window norms come from integral images.
+    """
+    def __init__(self, image):
+        self.image = image
+        self.height, self.width = image.shape[:2]
+        self.shape = (cv2.getOptimalDFTSize(self.height), cv2.getOptimalDFTSize(self.width))
+        data = image.astype(np.float64)
+        if data.ndim == 2:
+            data = data[..., None]
+        self.spectrum = np.fft.rfft2(data, s=self.shape, axes=(0, 1))
+        sums, squares = cv2.integral2(image, sdepth=cv2.CV_64F, sqdepth=cv2.CV_64F)
+        self._sums = sums if sums.ndim == 3 else sums[..., None]
+        self._squares = squares if squares.ndim == 3 else squares[..., None]
+
+    @staticmethod
+    def _window(table, height, width):
+        """Sum over every height x width window from an integral image."""
+        return table[height:, width:] - table[:-height, width:] - table[height:, :-width] + table[:-height, :-width]
+
+    def match(self, template, gray=False):
+        """Normalised correlation map of template over the image, like cv2.TM_CCOEFF_NORMED."""
+        conj, norm = template.spectrum(self.shape, gray)
+        h, w = template.height, template.width
+        numerator = np.fft.irfft2((self.spectrum * conj).sum(axis=2), s=self.shape)
+        numerator = numerator[:self.height - h + 1, :self.width - w + 1]
+        sums = self._window(self._sums, h, w)
+        variance = (self._window(self._squares, h, w) - sums * sums / (h * w)).sum(axis=2)
+        denominator = np.sqrt(np.maximum(variance, 0.0)) * norm
+        # OpenCV's handling of flat windows: clamp near-ties to +/-1, zero the rest
+        magnitude = np.abs(numerator)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            result = np.where(magnitude < denominator, numerator / denominator,
+                              np.where(magnitude < denominator * 1.125, np.sign(numerator), 0.0))
+        return result.astype(np.float32)
+
+class TemplateBank:
+    """Loads every template group once and keeps it decoded in memory.
+
+    With a cache_path, decoded and preprocessed templates are also kept in
+    one .npz bundle, reused as long as the SHA-1 of every asset file still
+    matches, so later starts skip decoding and preprocessing.
+    """
+    BUNDLE_FORMAT = 1
+
+    def __init__(self, assets_dir, groups=None, cache_path=None):
+        self.assets_dir = assets_dir
+        self.groups = dict(groups or TEMPLATE_GROUPS)
+        self.cache_path = cache_path
+        self.from_cache = False # Whether the last reload came from the bundle
+        self._templates: Dict[str, List[Template]] = {}
+        self.version = 0 # Bumped on every reload so caches derived from the bank can refresh
+        self.reload()
+
+    def _manifest(self):
+        """Asset files of every group with their hashes; the bundle is valid while this is unchanged."""
+        manifest = {'format': self.BUNDLE_FORMAT, 'groups': {}}
+        for group, pattern in self.groups.items():
+            files = []
+            for path in sorted(glob.glob(os.path.join(self.assets_dir, pattern))):
+                with open(path, 'rb') as f:
+                    files.append([os.path.basename(path), hashlib.sha1(f.read()).hexdigest()])
+            manifest['groups'][group] = files
+        return manifest
+
+    def _load_bundle(self, manifest) -> Optional[Dict[str, List[Template]]]:
+        try:
+            with np.load(self.cache_path, allow_pickle=False) as bundle:
+                stored = json.loads(str(bundle['manifest']))
+                if {k: v for k, v in stored.items() if k != 'norms'} != manifest:
+                    return None # Assets changed since the bundle was written
+                templates = {}
+                for group, files in manifest['groups'].items():
+                    templates[group] = [
+                        Template(name, bundle[f'{group}/{name}/image'], gray=bundle[f'{group}/{name}/gray'],
+                                 mean=bundle[f'{group}/{name}/mean'], norm=stored['norms'][f'{group}/{name}'])
+                        for name, _ in files]
+                return templates
+        except (OSError, KeyError, ValueError) as e:
+            print(f"Ignoring template bundle {self.cache_path}: {e}")
+            return None
+
+    def _save_bundle(self, manifest, templates):
+        arrays, norms = {}, {}
+        for group, loaded in templates.items():
+            for template in loaded:
+                key = f'{group}/{template.name}'
+                arrays[f'{key}/image'] = template.image
+                arrays[f'{key}/gray'] = template.gray
+                arrays[f'{key}/mean'] = template.mean
+                norms[key] = template.norm
+        arrays['manifest'] = np.array(json.dumps(dict(manifest, norms=norms)))
+        try:
+            folder = os.path.dirname(self.cache_path)
+            if folder:
+                os.makedirs(folder, exist_ok=True)
+            temp = self.cache_path + '.tmp'
+            with open(temp, 'wb') as f:
+                np.savez_compressed(f, **arrays)
+            os.replace(temp, self.cache_path)
+        except OSError as e:
+            print(f"Error writing template bundle {self.cache_path}: {e}")
+
+    def reload(self):
+        """Re-read all templates from disk, e.g. after swapping asset packs."""
+        manifest = self._manifest() if self.cache_path else None
+        templates = self._load_bundle(manifest) if manifest and os.path.exists(self.cache_path) else None
+        self.from_cache = templates is not None
+        if templates is None:
+            templates = {}
+            for group, pattern in self.groups.items():
+                loaded = []
+                for path in sorted(glob.glob(os.path.join(self.assets_dir, pattern))):
+                    image = cv2.imread(path)
+                    if image is None:
+                        print(f"Error loading template {path}")
+                        continue
+                    loaded.append(Template(os.path.basename(path), image))
+                templates[group] = loaded
+            if manifest and sum(len(t) for t in templates.values()) == \
+                    sum(len(files) for files in manifest['groups'].values()):
+                self._save_bundle(manifest, templates) # Only if every asset decoded
+        # Swap in one assignment so the macro thread never sees a partial bank
+        self._templates = templates
+        self.version += 1
+        return self
+
+    def get(self, group) -> List[Template]:
+        """Return the templates of a group (empty if none were found)."""
+        return self._templates.get(group, [])
+
+    def count(self):
+        """Total number of loaded templates across all groups."""
+        return sum(len(t) for t in self._templates.values())
+
+class LatencyStats:
+    """Rolling per-stage latency samples with p50/p95/p99 summaries.
+
+    Each stage keeps its last `window` samples. Stages are free-form names,
+    e.g. 'capture', 'match:capture3.PNG' or 'bite_to_click'.
+    """
+    PERCENTILES = (50, 95, 99)
+
+    def __init__(self, window=2000):
+        self.window = window
+        self._samples: Dict[str, deque] = {}
+        self._counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage, seconds):
+        """Record one sample for stage, in seconds."""
+        with self._lock:
+            samples = self._samples.get(stage)
+            if samples is None:
+                samples = self._samples[stage] = deque(maxlen=self.window)
+                self._counts[stage] = 0
+            samples.append(seconds)
+            self._counts[stage] += 1
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Per-stage count and percentiles of the rolling window, in milliseconds."""
+        with self._lock:
+            snapshot = {stage: (np.array(samples), self._counts[stage]) for stage, samples in self._samples.items()}
+        summary = {}
+        for stage, (samples, count) in sorted(snapshot.items()):
+            ms = samples * 1000.0
+            row = {'count': count, 'mean_ms': float(ms.mean()), 'max_ms': float(ms.max())}
+            for p, value in zip(self.PERCENTILES, np.percentile(ms, self.PERCENTILES)):
+                row[f'p{p}_ms'] = float(value)
+            summary[stage] = row
+        return summary
+
+    def export(self, path):
+        """Write the summary to path as CSV (if it ends in .csv) or JSON."""
+        summary = self.summary()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if path.lower().endswith('.csv'):
+            fields = ['stage', 'count', 'mean_ms'] + [f'p{p}_ms' for p in self.PERCENTILES] + ['max_ms']
+            with open(path, 'w', newline='') as f:
+                writer = csv.DictWriter(f, fieldnames=fields)
+                writer.writeheader()
+                for stage, row in summary.items():
+                    writer.writerow(dict(row, stage=stage))
+        else:
+            with open(path, 'w') as f:
+                json.dump(summary, f, indent=2)
+        return path
+
+class HotLoopProfiler:
+    """cProfile and tracemalloc over the macro loop, switched on and off while it runs.
+
+    start() and stop() must run on the thread being profiled (post them to
+    its EventLoop). begin_frame()/end_frame() bracket each frame: cProfile
+    only runs between them, so idle waits stay out of the report, and the
+    totals are divided by the number of frames. While inactive the hot loop
+    only reads `active`.
+    """
+    TRACE_FRAMES = 1 # Traceback depth per allocation; one frame keeps tracemalloc's own overhead low
+    IGNORED = (tracemalloc.__file__, '<frozen importlib._bootstrap>', '<frozen importlib._bootstrap_external>', '<unknown>')
+
+    def __init__(self, top=25):
+        self.top = top # Functions and allocation sites kept in the report
+        self.active = False
+        self._profile: Optional[cProfile.Profile] = None
+        self._snapshot = None
+        self._owns_tracing = False
+        self._started = 0.0
+        self._frames = 0
+        self._frame_base = 0
+        self._peaks: List[int] = [] # Highest traced memory above the frame's starting point, per frame
+
+    def start(self):
+        """Begin profiling the calling thread and tracing allocations."""
+        if self.active:
+            return
+        self._owns_tracing = not tracemalloc.is_tracing()
+        if self._owns_tracing:
+            tracemalloc.start(self.TRACE_FRAMES)
+        self._snapshot = tracemalloc.take_snapshot()
+        self._frames = 0
+        self._peaks = []
+        self._started = time.perf_counter()
+        self._profile = cProfile.Profile()
+        self.active = True
+
+    def begin_frame(self):
+        self._frame_base = tracemalloc.get_traced_memory()[0]
+        if hasattr(tracemalloc, 'reset_peak'): # Python 3.9+
+            tracemalloc.reset_peak()
+        self._profile.enable()
+
+    def end_frame(self):
+        self._profile.disable()
+        self._frames += 1
+        if hasattr(tracemalloc, 'reset_peak'):
+            self._peaks.append(tracemalloc.get_traced_memory()[1] - self._frame_base)
+
+    def stop(self) -> Optional[dict]:
+        """Stop profiling and return the report, or None if it was not running."""
+        if not self.active:
+            return None
+        self.active = False
+        seconds = time.perf_counter() - self._started
+        snapshot = tracemalloc.take_snapshot()
+        if self._owns_tracing:
+            tracemalloc.stop()
+        frames = max(self._frames, 1)
+
+        functions = []
+        for (filename, line, name), (_, calls, total, cumulative, _) in pstats.Stats(self._profile).stats.items():
+            functions.append({
+                'function': f"{os.path.basename(filename)}:{line}({name})", 'calls': calls,
+                'total_ms': total * 1000.0, 'cumulative_ms': cumulative * 1000.0,
+                'cumulative_ms_per_frame': cumulative * 1000.0 / frames,
+            })
+        functions.sort(key=lambda row: row['cumulative_ms'], reverse=True)
+
+        filters = [tracemalloc.Filter(False, pattern) for pattern in self.IGNORED]
+        growth = snapshot.filter_traces(filters).compare_to(self._snapshot.filter_traces(filters), 'lineno')
+        sites = []
+        for stat in sorted(growth, key=lambda stat: stat.size_diff, reverse=True)[:self.top]:
+            if stat.size_diff <= 0:
+                break
+            frame = stat.traceback[0]
+            sites.append({
+                'site': f"{os.path.basename(frame.filename)}:{frame.lineno}", 'bytes': stat.size_diff,
+                'bytes_per_frame': stat.size_diff / frames, 'blocks_per_frame': stat.count_diff / frames,
+            })
+        report = {'frames': self._frames, 'seconds': seconds, 'functions': functions[:self.top],
+                  'allocation_sites': sites}
+        if self._peaks:
+            peaks = np.array(self._peaks, dtype=np.float64)
+            report['peak_bytes_per_frame'] = {'mean': float(peaks.mean()), 'p50': float(np.percentile(peaks, 50)),
+                                              'p95': float(np.percentile(peaks, 95)), 'max': float(peaks.max())}
+        self._profile = self._snapshot = None
+        return report
+
+    @staticmethod
+    def export(report, path):
+        """Write report to path as JSON and print its top entries."""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Profiled {report['frames']} frames in {report['seconds']:.1f}s")
+        for row in report['functions'][:10]:
+            print(f"  {row['cumulative_ms_per_frame']:8.3f} ms/frame  {row['calls']:8d} calls  {row['function']}")
+        peak = report.get('peak_bytes_per_frame')
+        if peak:
+            print(f"  Peak allocations per frame: {peak['p50'] / 1024:.0f} KiB p50, {peak['p95'] / 1024:.0f} KiB p95")
+        for row in report['allocation_sites'][:5]:
+            print(f"  {row['bytes_per_frame']:10.0f} B/frame retained  {row['site']}")
+        return path
+
+class MatchResult:
+    """Best match of one template group on a frame."""
+    def __init__(self, group):
+        self.group = group
+        self.score = -1.0
+        self.template: Optional[Template] = None
+        self.loc: Optional[Tuple[int, int]] = None # Top-left, frame coordinates
+        self.elapsed = 0.0 # Seconds spent matching this group
+        self.scores: Dict[str, float] = {} # Best raw score of every template in the group
+        self.timings: Dict[str, float] = {} # Seconds spent matching each template
+        self.pixels: Optional[int] = None # Colour prefilter pixel count, if the prefilter ran
+        self.rejected = False # True if the prefilter ruled the group out without matching
+
+    def found(self, confidence):
+        """True if the best template scored above confidence."""
+        return self.score > confidence
+
+    def __repr__(self):
+        name = self.template.name if self.template else None
+        return f"MatchResult({self.group}, score={self.score:.3f}, template={name}, loc={self.loc})"
+
+class TemplateDetector:
+    """Scores every template of the requested groups against a frame in one pass.
+
+    Templates of the same size and match mode are matched as one batch that
+    reuses a single result map; batches run on a small thread pool since
+    OpenCV releases the GIL while matching. Each group is matched according
+    to its MatchConfig (full colour, grayscale or coarse-to-fine).
+    """
+    def __init__(self, bank, configs=None, workers=None, stats=None):
+        self.bank = bank
+        self.configs = configs or match_configs()
+        self.stats = stats # Optional LatencyStats for per-template match times
+        if workers is None:
+            workers = min(4, os.cpu_count() or 1)
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='match') if workers > 1 else None
+        self._result_maps = {}
+        self._prefilters: Dict[str, Optional[ColorPrefilter]] = {}
+        self._prefilter_version = None
+
+    def prefilter(self, group) -> Optional[ColorPrefilter]:
+        """The group's colour prefilter, derived from the bank; None if it has no distinctive colours."""
+        if self._prefilter_version != self.bank.version:
+            self._prefilters = {}
+            self._prefilter_version = self.bank.version
+        if group not in self._prefilters:
+            prefilter = ColorPrefilter.from_templates(self.bank.get(group), self.bank.get('water'))
+            if prefilter is None:
+                print(f"No distinctive colours for '{group}' templates; colour prefilter disabled for it")
+            self._prefilters[group] = prefilter
+        return self._prefilters[group]
+
+    def config(self, group) -> MatchConfig:
+        config = self.configs.get(group)
+        if config is None:
+            config = self.configs[group] = MatchConfig({'found': 0.8})
+        return config
+
+    def threshold(self, group, name='found'):
+        """Confidence threshold `name` of a group, e.g. threshold('bobber', 'present')."""
+        return self.config(group).threshold(name)
+
+    def max_size(self, groups):
+        """Largest (width, height) among the templates of the given groups."""
+        sizes = [t.size for group in groups for t in self.bank.get(group)]
+        return (max([w for w, _ in sizes], default=0), max([h for _, h in sizes], default=0))
+
+    def _result_map(self, key, image, template):
+        """Reusable float32 result map for matching template over image."""
+        result = self._result_maps.get(key)
+        if result is None:
+            if len(self._result_maps) > 64:
+                self._result_maps.clear() # Window sizes vary at region edges
+            shape = (image.shape[0] - template.shape[0] + 1, image.shape[1] - template.shape[1] + 1)
+            result = self._result_maps[key] = np.empty(shape, dtype=np.float32)
+        return result
+
+    def _match_coarse_to_fine(self, prepared, template, config):
+        """Find candidates on the downscaled frame, then confirm them at full resolution."""
+        small = prepared[(config.scale, config.coarse_gray)]
+        small_template = template.variant(config.scale, config.coarse_gray)
+        if small_template.shape[0] > small.shape[0] or small_template.shape[1] > small.shape[1]:
+            return -1.0, None
+        coarse = cv2.matchTemplate(small, small_template, cv2.TM_CCOEFF_NORMED)
+        full = prepared[(1.0, config.gray)]
+        full_template = template.variant(1.0, config.gray)
+        pad = int(np.ceil(1.0 / config.scale)) + 1
+        half_h, half_w = small_template.shape[0] // 2, small_template.shape[1] // 2
+        best_score, best_loc = -1.0, None
+        confirmed = False
+        for _ in range(config.candidates):
+            _, coarse_score, _, (cx, cy) = cv2.minMaxLoc(coarse)
+            fx, fy = int(cx / config.scale), int(cy / config.scale)
+            if best_loc is None:
+                # Until a candidate is confirmed, report the coarse estimate
+                best_score, best_loc = coarse_score, (fx, fy)
+            if coarse_score < config.coarse_confidence:
+                break
+            # Suppress this peak so the next candidate is somewhere else
+            coarse[max(0, cy - half_h):cy + half_h + 1, max(0, cx - half_w):cx + half_w + 1] = -1.0
+            x0, y0 = max(0, fx - pad), max(0, fy - pad)
+            x1 = min(full.shape[1], fx + template.width + pad)
+            y1 = min(full.shape[0], fy + template.height + pad)
+            if x1 - x0 < template.width or y1 - y0 < template.height:
+                continue
+            result = cv2.matchTemplate(full[y0:y1, x0:x1], full_template, cv2.TM_CCOEFF_NORMED)
+            _, score, _, (lx, ly) = cv2.minMaxLoc(result)
+            if not confirmed or score > best_score:
+                best_score, best_loc = score, (x0 + lx, y0 + ly)
+                confirmed = True
+        return best_score, best_loc
+
+    def _match_fft(self, prepared, batch):
+        """Match a batch of FFT-mode templates against one spectrum of the view."""
+        gray = self.config(batch[0][0]).gray
+        start = time.perf_counter()
+        correlator = FFTCorrelator(prepared[(1.0, gray)])
+        # Share the frame transform evenly among the templates' timings
+        setup = (time.perf_counter() - start) / len(batch)
+        matches = []
+        for group, template in batch:
+            start = time.perf_counter()
+            try:
+                _, max_val, _, max_loc = cv2.minMaxLoc(correlator.match(template, gray))
+            except Exception as e:
+                print(f"Error processing template {template.name}: {e}")
+                max_val, max_loc = -1.0, None
+            matches.append((group, template, max_val, max_loc, setup + time.perf_counter() - start))
+        return matches
+
+    def _match_batch(self, prepared, batch):
+        """Match a batch of same-sized, same-mode templates, reusing one result map."""
+        if batch and self.config(batch[0][0]).fft and not self.config(batch[0][0]).coarse(batch[0][1]):
+            return self._match_fft(prepared, batch)
+        matches = []
+        for group, template in batch:
+            config = self.config(group)
+            start = time.perf_counter()
+            try:
+                if config.coarse(template):
+                    max_val, max_loc = self._match_coarse_to_fine(prepared, template, config)
+                else:
+                    image = prepared[(1.0, config.gray)]
+                    tpl = template.variant(1.0, config.gray)
+                    key = (image.shape[0], image.shape[1], template.height, template.width, config.gray)
+                    result = self._result_map(key, image, tpl)
+                    cv2.matchTemplate(image, tpl, cv2.TM_CCOEFF_NORMED, result=result)
+                    _, max_val, _, max_loc = cv2.minMaxLoc(result)
+            except Exception as e:
+                print(f"Error processing template {template.name}: {e}")
+                max_val, max_loc = -1.0, None
+            matches.append((group, template, max_val, max_loc, time.perf_counter() - start))
+        return matches
+
+    def _prepare(self, view, groups):
+        """Grayscale and downscaled copies of view needed by the groups' configs."""
+        prepared = {(1.0, False): view}
+        gray = None
+        for group in groups:
+            config = self.config(group)
+            keys = [(1.0, config.gray)]
+            if config.scale < 1.0:
+                keys.append((config.scale, config.coarse_gray))
+            for scale, want_gray in keys:
+                if (scale, want_gray) in prepared:
+                    continue
+                source = view
+                if want_gray:
+                    if gray is None:
+                        gray = prepared[(1.0, True)] = cv2.cvtColor(view, cv2.COLOR_BGR2GRAY)
+                    source = gray
+                if scale < 1.0:
+                    prepared[(scale, want_gray)] = cv2.resize(source, None, fx=scale, fy=scale,
+                                                              interpolation=cv2.INTER_AREA)
+        return prepared
+
+    def _batches(self, view, groups) -> Dict[tuple, list]:
+        """Group templates by size and mode, skipping any larger than the search area."""
+        batches: Dict[tuple, list] = {}
+        for group in groups:
+            config = self.config(group)
+            # All of them if a new asset pack has none of the calibrated templates
+            templates = [t for t in self.bank.get(group) if config.uses(t)] or self.bank.get(group)
+            for template in templates:
+                if template.height > view.shape[0] or template.width > view.shape[1]:
+                    continue
+                if config.fft and not config.coarse(template):
+                    key = ('fft', config.gray) # One spectrum of the view serves every size
+                else:
+                    key = (template.size, config.gray, config.coarse(template) and config.scale)
+                batches.setdefault(key, []).append((group, template))
+        return batches
+
+    def _merge(self, matches, offset, results):
+        """Fold (group, template, score, loc, elapsed) matches into results."""
+        for group, template, score, loc, elapsed in matches:
+            result = results[group]
+            result.scores[template.name] = max(score, result.scores.get(template.name, -1.0))
+            result.timings[template.name] = result.timings.get(template.name, 0.0) + elapsed
+            result.elapsed += elapsed
+            score += self.config(group).offsets.get(template.name, 0.0) # Calibrated per-template threshold
+            if score > result.score and loc is not None:
+                result.score = score
+                result.template = template
+                result.loc = (loc[0] + offset[0], loc[1] + offset[1])
+
+    def _detect_in(self, view, offset, groups, results):
+        """Match groups on view and merge the scores into results (offset maps view to frame)."""
+        prepared = self._prepare(view, groups)
+        batches = self._batches(view, groups)
+        if self._pool is not None and len(batches) > 1:
+            batch_matches = self._pool.map(lambda b: self._match_batch(prepared, b), batches.values())
+        else:
+            batch_matches = (self._match_batch(prepared, b) for b in batches.values())
+        for matches in batch_matches:
+            self._merge(matches, offset, results)
+
+    def detect(self, frame, groups, window=None) -> Dict[str, MatchResult]:
+        """Match all templates of groups on frame, optionally inside window (x0, y0, x1, y1)."""
+        start = time.perf_counter()
+        x0, y0 = 0, 0
+        view = frame
+        if window is not None:
+            x0, y0, x1, y1 = window
+            view = frame[y0:y1, x0:x1]
+        results = {group: MatchResult(group) for group in groups}
+
+        plain = []
+        for group in groups:
+            prefilter = self.prefilter(group) if self.config(group).prefilter else None
+            if prefilter is None:
+                plain.append(group)
+                continue
+            scan_start = time.perf_counter()
+            pixels, boxes = prefilter.scan(view, pad=self.max_size((group,)))
+            if self.stats is not None:
+                self.stats.add(f'prefilter:{group}', time.perf_counter() - scan_start)
+            results[group].pixels = pixels
+            if boxes is None:
+                plain.append(group) # Too scattered to be worth matching box by box
+            elif not boxes:
+                results[group].rejected = True # No plausible colours: skip matching entirely
+            else:
+                for bx0, by0, bx1, by1 in boxes:
+                    self._detect_in(view[by0:by1, bx0:bx1], (x0 + bx0, y0 + by0), (group,), results)
+        if plain:
+            self._detect_in(view, (x0, y0), plain, results)
+
+        if self.stats is not None:
+            for result in results.values():
+                for name, elapsed in result.timings.items():
+                    self.stats.add(f'match:{name}', elapsed)
+            self.stats.add('detect', time.perf_counter() - start)
+        return results
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+
+def _attach_shared(name):
+    """Open an existing shared memory block without letting this process's tracker unlink it."""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False) # Python 3.13+
+    except TypeError:
+        shm = shared_memory.SharedMemory(name=name)
+        if os.name == 'posix':
+            # Older versions register every attach and unlink the block when the worker exits
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+def _detection_worker(assets_dir, configs, tasks, results):
+    """Worker process loop for ProcessDetector: match template batches on frames in shared memory."""
+    bank = TemplateBank(assets_dir) # Decoded once per worker, reloaded only when the parent's bank changes
+    detector = TemplateDetector(bank, configs, workers=1)
+    version = None
+    shm = None
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        frame_id, bank_version, shm_name, shape, batch = task
+        if version is not None and bank_version != version:
+            bank.reload()
+        version = bank_version
+        try:
+            if shm is None or shm.name != shm_name:
+                if shm is not None:
+                    shm.close()
+                shm = _attach_shared(shm_name)
+            view = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf)
+            templates = {(t_group, t.name): t for t_group in {g for g, _ in batch} for t in bank.get(t_group)}
+            pairs = [(group, templates[(group, name)]) for group, name in batch if (group, name) in templates]
+            prepared = detector._prepare(view, {group for group, _ in pairs})
+            matches = [(group, template.name, score, loc, elapsed)
+                       for group, template, score, loc, elapsed in detector._match_batch(prepared, pairs)]
+            view = prepared = None # Release the shared buffer before it can be closed
+        except Exception as e:
+            print(f"Detection worker error: {e}")
+            matches = []
+        results.put((frame_id, matches))
+    if shm is not None:
+        shm.close()
+
+class ProcessDetector(TemplateDetector):
+    """TemplateDetector that spreads template batches over worker processes.
+
+    Each search area is copied once into a shared memory block that every
+    worker maps, so frames are never pickled. Workers load the template bank
+    themselves at startup. Results come back tagged with a frame ID, and any
+    that arrive after their frame was given up on are discarded.
+    """
+    def __init__(self, bank, configs=None, workers=2, stats=None, timeout=1.0):
+        super().__init__(bank, configs, workers=1, stats=stats)
+        self.timeout = timeout # Seconds to wait for a frame's batches before giving up on it
+        self.stale = 0 # Late results discarded
+        self._frame_id = 0
+        self._shm = None
+        self._frame = None
+        self._tasks = multiprocessing.Queue()
+        self._results = multiprocessing.Queue()
+        self._workers = [multiprocessing.Process(target=_detection_worker, daemon=True,
+                                                 args=(bank.assets_dir, self.configs, self._tasks, self._results))
+                         for _ in range(max(1, workers))]
+        for worker in self._workers:
+            worker.start()
+
+    def _share(self, view):
+        """Copy view into the shared frame block, growing it if needed."""
+        if self._shm is None or self._shm.size < view.nbytes:
+            self._release()
+            self._shm = shared_memory.SharedMemory(create=True, size=max(1, view.nbytes))
+        self._frame = np.ndarray(view.shape, dtype=np.uint8, buffer=self._shm.buf)
+        np.copyto(self._frame, view)
+        return self._shm.name
+
+    def _release(self):
+        if self._shm is not None:
+            self._frame = None
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+    def _detect_in(self, view, offset, groups, results):
+        batches = self._batches(view, groups)
+        if not batches:
+            return
+        self._frame_id += 1
+        frame_id = self._frame_id
+        shm_name = self._share(view)
+        templates = {}
+        for batch in batches.values():
+            for group, template in batch:
+                templates[(group, template.name)] = template
+            spec = [(group, template.name) for group, template in batch]
+            self._tasks.put((frame_id, self.bank.version, shm_name, view.shape, spec))
+
+        pending = len(batches)
+        deadline = time.perf_counter() + self.timeout
+        while pending:
+            try:
+                result_id, matches = self._results.get(timeout=max(0.0, deadline - time.perf_counter()))
+            except queue.Empty:
+                print(f"Detection workers timed out on frame {frame_id}")
+                break
+            if result_id != frame_id:
+                self.stale += 1 # Answer for a frame we already gave up on
+                continue
+            pending -= 1
+            self._merge([(group, templates[(group, name)], score, loc, elapsed)
+                         for group, name, score, loc, elapsed in matches], offset, results)
+
+    def close(self):
+        for _ in self._workers:
+            self._tasks.put(None)
+        for worker in self._workers:
+            worker.join(timeout=2)
+            if worker.is_alive():
+                worker.terminate()
+        self._release()
+
+def create_detector(bank, configs=None, detect_workers=0, stats=None) -> TemplateDetector:
+    """In-thread TemplateDetector, or a ProcessDetector when detect_workers > 0."""
+    if detect_workers > 0:
+        return ProcessDetector(bank, configs, workers=detect_workers, stats=stats)
+    return TemplateDetector(bank, configs, stats=stats)
+
+class FrameChangeGate:
+    """Cheap change detector used to skip template matching on unchanged frames.
+
+    Each frame is downscaled to grayscale and compared with the last frame
+    that was analysed. A frame counts as changed when more than min_changed
+    of its pixels differ by more than pixel_threshold grey levels. Every
+    max_skip frames a frame is let through anyway.
+    """
+    def __init__(self, pixel_threshold=12, min_changed=0.002, scale=0.25, max_skip=30):
+        self.pixel_threshold = pixel_threshold
+        self.min_changed = min_changed
+        self.scale = scale
+        self.max_skip = max_skip
+        self.frames = 0 # Frames seen
+        self.skipped = 0 # Frames reported unchanged
+        self.motion = False # Whether the last frame let through actually differed from the reference
+        self._skipped_in_row = 0
+        self._small = None
+        self._gray = None
+        self._last = None
+        self._diff = None
+
+    def reset(self):
+        """Forget the reference frame so the next frame is always analysed."""
+        self._last = None
+        self._skipped_in_row = 0
+
+    def changed(self, frame):
+        """Return True if frame should be analysed, False if it can be skipped."""
+        self.frames += 1
+        if self.pixel_threshold <= 0:
+            self.motion = True # No way to tell, so assume the worst
+            return True # Gate disabled
+        height, width = frame.shape[:2]
+        size = (max(1, int(width * self.scale)), max(1, int(height * self.scale)))
+        if self._small is None or self._small.shape[:2] != (size[1], size[0]):
+            self._small = np.empty((size[1], size[0], 3), dtype=np.uint8)
+            self._gray = np.empty((size[1], size[0]), dtype=np.uint8)
+            self._diff = np.empty_like(self._gray)
+            self._last = None
+        cv2.resize(frame, size, dst=self._small, interpolation=cv2.INTER_AREA)
+        cv2.cvtColor(self._small, cv2.COLOR_BGR2GRAY, dst=self._gray)
+
+        compared = self._last is not None and self._skipped_in_row < self.max_skip
+        if compared:
+            cv2.absdiff(self._gray, self._last, dst=self._diff)
+            cv2.threshold(self._diff, self.pixel_threshold, 255, cv2.THRESH_BINARY, dst=self._diff)
+            if cv2.countNonZero(self._diff) <= self.min_changed * self._diff.size:
+                self.skipped += 1
+                self._skipped_in_row += 1
+                return False
+        self.motion = compared # Not motion when let through by reset() or max_skip
+
+        # Analysed frames become the new reference (swap buffers, no copy)
+        if self._last is None:
+            self._last = np.empty_like(self._gray)
+        self._last, self._gray = self._gray, self._last
+        self._skipped_in_row = 0
+        return True
+
+# Bite trigger settings: 'temporal' fuses a window of scores, 'frame' is the single-frame rule it replaced
+BITE_TRIGGERS = {
+    'temporal': {'confirmations': 2, 'early': 0.15, 'hysteresis': 0.05, 'bobber_weight': 0.5},
+    'frame': {'confirmations': 1, 'early': 0.0, 'hysteresis': 0.0, 'bobber_weight': 0.0},
+}
+
+class BiteTrigger:
+    """Bite decision over a sliding window of per-frame bite and bobber scores.
+
+    The fused score of a frame is its bite score plus bobber_weight times how
+    far the bobber score fell below its median over the window (the bite
+    sprite covers the bobber). A frame whose bite score alone is above
+    threshold fires at once, as the single-frame rule does. Below that, a
+    frame confirms a bite when the fused score is above threshold, or above
+    threshold - early while the trend over the last SLOPE_FRAMES frames is
+    rising, and the trigger fires after `confirmations` confirming frames in
+    a row. Either way it re-arms only once the
+    fused score falls below threshold - early - hysteresis. While firing is
+    held back (see update()), a confirmed bite stays confirmed and fires on
+    the first confirming frame after it is allowed.
+    """
+    SLOPE_FRAMES = 3
+
+    def __init__(self, threshold, confirmations=2, early=0.15, hysteresis=0.05, bobber_weight=0.5, window=16):
+        self.threshold = threshold
+        self.confirmations = max(1, confirmations)
+        self.early = early
+        self.hysteresis = hysteresis
+        self.bobber_weight = bobber_weight
+        self.window = window
+        self._times = np.zeros(window, dtype=np.float64)
+        self._bobber = np.zeros(window, dtype=np.float32)
+        self._fused = np.zeros(window, dtype=np.float32)
+        self.reset()
+
+    def reset(self):
+        """Forget the window, e.g. for a new bobber."""
+        self._count = 0
+        self.streak = 0 # Confirming frames in a row
+        self._armed = True
+
+    def _slope(self):
+        """Least-squares slope of the fused score over the last SLOPE_FRAMES frames, per second."""
+        n = min(self._count, self.SLOPE_FRAMES)
+        if n < 2:
+            return 0.0
+        slots = np.arange(self._count - n, self._count) % self.window
+        times = self._times[slots] - self._times[slots].mean()
+        scores = self._fused[slots] - self._fused[slots].mean() # Centred too, so a flat score gives exactly 0
+        spread = float(np.dot(times, times))
+        return float(np.dot(times, scores)) / spread if spread > 0 else 0.0
+
+    def update(self, timestamp, bite, bobber, allowed=True) -> bool:
+        """Add one analysed frame's scores; True if it fires the trigger.
+
+        With allowed False the frame still counts, but the trigger neither
+        fires nor disarms.
+        """
+        slot = self._count % self.window
+        self._times[slot] = timestamp
+        self._bobber[slot] = bobber
+        fused = bite
+        if self.bobber_weight and self._count:
+            baseline = float(np.median(self._bobber[:min(self._count, self.window)]))
+            fused += self.bobber_weight * max(0.0, baseline - bobber)
+        self._fused[slot] = fused
+        self._count += 1
+        early = self.threshold - self.early
+        if not self._armed:
+            self._armed = fused < early - self.hysteresis
+            return False
+        if bite > self.threshold:
+            self.streak = self.confirmations # A clear bite needs no confirming
+        elif fused > self.threshold or (fused > early and self._slope() > 0):
+            self.streak += 1
+        else:
+            self.streak = 0
+        if self.streak >= self.confirmations:
+            if not allowed:
+                self.streak = self.confirmations # Held until firing is allowed
+                return False
+            self.streak = 0
+            self._armed = False
+            return True
+        return False
+
+    @property
+    def confirmed(self):
+        """True if the last frame completed the confirmations."""
+        return self.streak >= self.confirmations
+
+class BiteWatcher:
+    """Per-frame Phase 2 analysis: change gate, tracking window and one detector pass.
+
+    Shared by the live macro and the replay harness so both run exactly the
+    same detection logic.
+    """
+    def __init__(self, detector, diff_threshold=12, trigger='temporal', confirmations=None):
+        self.detector = detector
+        self.bite_confidence = detector.threshold('bite')
+        options = dict(BITE_TRIGGERS[trigger])
+        if confirmations is not None:
+            options['confirmations'] = confirmations
+        self.trigger = BiteTrigger(self.bite_confidence, **options)
+        self.presence_confidence = detector.threshold('bobber', 'present') # Lower than 'found'
+        self.tracker = BobberTracker(min_score=self.presence_confidence)
+        self.gate = FrameChangeGate(pixel_threshold=diff_threshold)
+        # Search window must fit the largest bobber/bite template
+        self.max_size = detector.max_size(('bobber', 'bite'))
+
+    def start(self, bobber):
+        """Begin watching a bobber found by a full-region search."""
+        self.tracker.update(bobber.score, bobber.loc, bobber.template.size)
+        self.gate.reset()
+        self.trigger.reset()
+
+    def analyze(self, frame) -> Optional[Dict[str, MatchResult]]:
+        """Return bite/bobber results for frame, or None if it was skipped as unchanged."""
+        if not self.gate.changed(frame) and not self.pending and not self.trigger.confirmed:
+            return None # Nothing changed since the last analysed frame; its result still holds
+        window = self.tracker.window(frame.shape, self.max_size)
+        results = self.detector.detect(frame, ('bite', 'bobber'), window=window)
+        if not results['bite'].found(self.bite_confidence):
+            if not results['bobber'].found(self.presence_confidence) and window is not None:
+                # Lost it in the tracking window; confirm against the whole region
+                self.tracker.reset()
+                results['bobber'] = self.detector.detect(frame, ('bobber',))['bobber']
+            bobber = results['bobber']
+            if bobber.found(self.presence_confidence):
+                self.tracker.update(bobber.score, bobber.loc, bobber.template.size)
+        return results
+
+    def bite(self, results, stamp, allowed=True):
+        """Feed the frame grabbed at stamp to the bite trigger; True if it fires."""
+        return self.trigger.update(stamp, results['bite'].score, results['bobber'].score, allowed)
+
+    @property
+    def pending(self):
+        """True while a bite is being confirmed."""
+        return 0 < self.trigger.streak < self.trigger.confirmations
+
+    def bobber_present(self, results):
+        return results['bobber'].found(self.presence_confidence)
+
+class RecoveryMonitor:
+    """Incremental presence score of a paused spot, fed with frames sampled at a low rate.
+
+    A sample's evidence is the better of its water and bobber scores, each
+    relative to its threshold, so 1.0 means just found. The presence score
+    is a moving average of the evidence. The scene counts as stable once the
+    presence score reaches 1.0 and the last STABLE_FRAMES samples each
+    cleared it without a scene change (more than SCENE_CHANGE of the pixels
+    moving, as on a loading screen or a teleport).
+    """
+    STABLE_FRAMES = 3
+    SMOOTHING = 0.5 # Weight of the newest sample in the presence score
+    MAX_EVIDENCE = 2.0 # One very clear frame cannot outweigh the others
+    SCENE_CHANGE = 0.05
+
+    def __init__(self, bobber_threshold, water_threshold):
+        self.bobber_threshold = bobber_threshold
+        self.gate = FrameChangeGate(min_changed=self.SCENE_CHANGE, max_skip=sys.maxsize)
+        self.reset(water_threshold)
+
+    def reset(self, water_threshold):
+        """Start over for a new pause, verifying water against water_threshold."""
+        self.water_threshold = water_threshold
+        self.presence = 0.0
+        self.streak = 0 # Stable samples in a row
+        self.samples = 0
+        self.gate.reset()
+
+    def update(self, frame, results) -> bool:
+        """Add one sample's water/bobber results; True once the scene is stable."""
+        evidence = max(results['water'].score / self.water_threshold,
+                       results['bobber'].score / self.bobber_threshold)
+        evidence = min(evidence, self.MAX_EVIDENCE)
+        self.presence += self.SMOOTHING * (evidence - self.presence)
+        moved = self.gate.changed(frame) and self.gate.motion
+        self.streak = self.streak + 1 if evidence >= 1.0 and not moved else 0
+        self.samples += 1
+        return self.streak >= self.STABLE_FRAMES and self.presence >= 1.0
+
+class PollScheduler:
+    """Picks how long the capture thread waits between frames.
+
+    Each session asks for an interval that suits its state. While waiting
+    for a bite, frames are polled slowly right after the cast, the rate ramps
+    up as the time since the cast nears the earliest bites seen so far, and
+    it goes to full rate once the frame gate sees motion. The requested
+    interval is then held to the fps cap and to the CPU budget: the share of
+    wall time spent analysing frames.
+    """
+    MIN_SAMPLES = 5 # Bites needed before the learned distribution replaces the debounce
+    RAMP_QUANTILE = 5 # Percentile of cast-to-bite times treated as the earliest bite
+
+    def __init__(self, max_fps=60, min_fps=4, cpu_budget=1.0, motion_hold=1.0, history=50):
+        self.min_interval = 1.0 / max_fps if max_fps else 0.0
+        self.max_interval = 1.0 / min_fps
+        self.cpu_budget = cpu_budget # Fraction of one core; 1.0 allows back-to-back analysis
+        self.motion_hold = motion_hold # Seconds to stay at full rate after motion
+        self.bite_times = deque(maxlen=history) # Seconds from cast to bite
+        self.busy = 0.0 # Running average of seconds spent analysing one frame
+
+    def record_bite(self, seconds):
+        if seconds > 0:
+            self.bite_times.append(seconds)
+
+    def add_busy(self, seconds):
+        self.busy = seconds if self.busy == 0.0 else 0.9 * self.busy + 0.1 * seconds
+
+    def bite_wait(self, since_cast, debounce):
+        """Interval while watching for a bite since_cast seconds after the cast."""
+        fast_from = debounce # Bites before this are ignored anyway
+        if len(self.bite_times) >= self.MIN_SAMPLES:
+            fast_from = max(fast_from, 0.8 * float(np.percentile(self.bite_times, self.RAMP_QUANTILE)))
+        slow_until = fast_from / 2
+        if since_cast >= fast_from:
+            return self.min_interval
+        if since_cast <= slow_until:
+            return self.max_interval
+        # Linear ramp from the slow to the full rate
+        share = (since_cast - slow_until) / (fast_from - slow_until)
+        return self.max_interval + share * (self.min_interval - self.max_interval)
+
+    def interval(self, requested):
+        """The requested interval, held to the fps cap and the CPU budget."""
+        floor = self.min_interval
+        if self.cpu_budget > 0:
+            floor = max(floor, self.busy / self.cpu_budget)
+        return max(requested, floor)
+
+class FrameSource:
+    """Produces BGR frames of a screen region.
+
+    grab() returns a buffer that is reused by the next call, so callers
+    that need to keep a frame around must copy it.
+    """
+    def __init__(self, region):
+        self.region = region
+        self._buffer = None
+        # Seconds spent in the last grab() on the raw grab and on colour conversion
+        self.grab_time = 0.0
+        self.convert_time = 0.0
+
+    def _output(self, height, width):
+        """Return the reusable BGR output buffer for the given size."""
+        if self._buffer is None or self._buffer.shape[:2] != (height, width):
+            self._buffer = np.empty((height, width, 3), dtype=np.uint8)
+        return self._buffer
+
+    def grab(self):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+class MssFrameSource(FrameSource):
+    """Grabs the region with mss and converts its BGRA view in place."""
+    def __init__(self, region):
+        super().__init__(region)
+        left, top, width, height = region
+        self.monitor = {'left': left, 'top': top, 'width': width, 'height': height}
+        self._sct = None
+
+    def grab(self):
+        # mss handles are not shareable across threads, so open on first use
+        if self._sct is None:
+            self._sct = mss.mss()
+        start = time.perf_counter()
+        shot = self._sct.grab(self.monitor)
+        grabbed = time.perf_counter()
+        bgra = np.frombuffer(shot.raw, dtype=np.uint8).reshape(shot.height, shot.width, 4)
+        frame = cv2.cvtColor(bgra, cv2.COLOR_BGRA2BGR, dst=self._output(shot.height, shot.width))
+        self.grab_time, self.convert_time = grabbed - start, time.perf_counter() - grabbed
+        return frame
+
+    def close(self):
+        if self._sct is not None:
+            self._sct.close()
+            self._sct = None
+
+class PyAutoGUIFrameSource(FrameSource):
+    """Fallback grabber using pyautogui.screenshot (PIL)."""
+    def grab(self):
+        start = time.perf_counter()
+        shot = pyautogui.screenshot(region=self.region)
+        grabbed = time.perf_counter()
+        rgb = np.asarray(shot)
+        frame = cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR, dst=self._output(*rgb.shape[:2]))
+        self.grab_time, self.convert_time = grabbed - start, time.perf_counter() - grabbed
+        return frame
+
+class FileFrameSource(FrameSource):
+    """Replays frames from a recording, a .npy stack, an image file or a folder of images."""
+    def __init__(self, path, region=None, loop=True):
+        super().__init__(region)
+        self.path = path
+        self.loop = loop
+        self.index = 0
+        if Recording.is_recording(path):
+            self.frames = Recording(path)
+        elif os.path.isdir(path):
+            files = sorted(f for f in os.listdir(path) if f.lower().endswith(('.png', '.jpg', '.bmp')))
+            self.frames = [cv2.imread(os.path.join(path, f)) for f in files]
+        elif path.endswith('.npy'):
+            # Memory-mapped so large recordings are not read up front
+            self.frames = np.load(path, mmap_mode='r')
+            if self.frames.ndim == 3:
+                self.frames = self.frames[np.newaxis]
+        else:
+            self.frames = [cv2.imread(path)]
+        if len(self.frames) == 0 or self.frames[0] is None:
+            raise ValueError(f"No frames found in {path}")
+
+    def __len__(self):
+        return len(self.frames)
+
+    def grab(self):
+        if self.index >= len(self.frames):
+            if not self.loop:
+                return None
+            self.index = 0
+        start = time.perf_counter()
+        frame = self.frames[self.index]
+        self.index += 1
+        out = self._output(*frame.shape[:2])
+        np.copyto(out, frame)
+        self.grab_time = time.perf_counter() - start
+        return out
+
+class FrameRecorder:
+    """Writes captured frames to a recording folder for offline replay.
+
+    Layout of a recording folder:
+      meta.json          frame shape, frame count and chunk sizes
+      frames-00000.npy   uint8 stacks of up to chunk_frames frames each
+      timestamps.npy     float64 perf_counter() time of every frame
+      events.json        actions taken while recording, e.g. cast and reel
+    Chunks are memory-mapped .npy files, so writing a frame is a single copy.
+    """
+    def __init__(self, path, chunk_frames=256):
+        self.path = path
+        self.chunk_frames = chunk_frames
+        self.shape = None
+        self.count = 0
+        self.skipped = 0 # Frames whose size did not match the first frame
+        self._chunk = None
+        self._chunk_counts: List[int] = []
+        self._timestamps: List[float] = []
+        self._events: List[dict] = []
+        self._lock = threading.Lock()
+        self.started = time.time()
+        os.makedirs(path, exist_ok=True)
+
+    def _chunk_path(self, index):
+        return os.path.join(self.path, f'frames-{index:05d}.npy')
+
+    def write(self, frame, timestamp):
+        """Append one frame grabbed at timestamp."""
+        if self.shape is None:
+            self.shape = frame.shape
+        elif frame.shape != self.shape:
+            self.skipped += 1
+            return
+        if self._chunk is None or self._chunk_counts[-1] >= self.chunk_frames:
+            self._flush_chunk()
+            self._chunk = np.lib.format.open_memmap(
+                self._chunk_path(len(self._chunk_counts)), mode='w+',
+                dtype=np.uint8, shape=(self.chunk_frames,) + self.shape)
+            self._chunk_counts.append(0)
+        self._chunk[self._chunk_counts[-1]] = frame
+        self._chunk_counts[-1] += 1
+        self._timestamps.append(timestamp)
+        self.count += 1
+
+    def mark(self, event, timestamp, **fields):
+        """Record an action (e.g. 'cast', 'reel') at timestamp; safe from any thread."""
+        with self._lock:
+            self._events.append(dict(fields, event=event, t=timestamp))
+
+    def _flush_chunk(self):
+        if self._chunk is None:
+            return
+        self._chunk.flush()
+        used = self._chunk_counts[-1]
+        if used < self.chunk_frames:
+            # Trim the unused tail of the last chunk
+            trimmed = np.array(self._chunk[:used])
+            self._chunk = None
+            np.save(self._chunk_path(len(self._chunk_counts) - 1), trimmed)
+        self._chunk = None
+
+    def close(self):
+        """Finish the last chunk and write the index files."""
+        self._flush_chunk()
+        np.save(os.path.join(self.path, 'timestamps.npy'), np.array(self._timestamps, dtype=np.float64))
+        with self._lock:
+            events = list(self._events)
+        with open(os.path.join(self.path, 'events.json'), 'w') as f:
+            json.dump(events, f, indent=1)
+        meta = {
+            'version': 1,
+            'shape': list(self.shape) if self.shape else None,
+            'count': self.count,
+            'chunks': self._chunk_counts,
+            'started': self.started,
+        }
+        with open(os.path.join(self.path, 'meta.json'), 'w') as f:
+            json.dump(meta, f, indent=1)
+
+class Recording:
+    """Read-only view of a folder written by FrameRecorder."""
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'meta.json')) as f:
+            self.meta = json.load(f)
+        self._chunks = [np.load(os.path.join(path, f'frames-{i:05d}.npy'), mmap_mode='r')[:n]
+                        for i, n in enumerate(self.meta['chunks'])]
+        self._starts = np.cumsum([0] + [len(c) for c in self._chunks])
+        self.timestamps = np.load(os.path.join(path, 'timestamps.npy'))
+        events_path = os.path.join(path, 'events.json')
+        self.events = []
+        if os.path.exists(events_path):
+            with open(events_path) as f:
+                self.events = json.load(f)
+
+    @staticmethod
+    def is_recording(path):
+        return os.path.isdir(path) and os.path.exists(os.path.join(path, 'meta.json'))
+
+    def __len__(self):
+        return int(self._starts[-1])
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        chunk = int(np.searchsorted(self._starts, index, side='right')) - 1
+        return self._chunks[chunk][index - self._starts[chunk]]
+
+    def frame_index(self, timestamp):
+        """Index of the last frame grabbed at or before timestamp."""
+        return max(0, int(np.searchsorted(self.timestamps, timestamp, side='right')) - 1)
+
+class FlightRecorder:
+    """Always-on ring of the most recent frames, detector scores and session events.
+
+    Frames live in an anonymous memory map allocated on the first frame, so
+    keeping them costs one copy per frame and no allocation or disk I/O.
+    dump() writes the ring out in FrameRecorder's layout (oldest frame
+    first), so the benchmark command can replay it, plus:
+      scores.npy   float32 (frames, spots, groups) best score of each
+                   SCORE_GROUPS group per spot, NaN where it was not matched
+    events.json holds the session events (cast, reel, bobber_lost, ...) of
+    the frames kept, with their state, score and value. dump() copies the
+    ring's slot order, timestamps and scores, and a background thread copies
+    the frames and writes them, one dump at a time; only the KEEP most
+    recent dumps are kept on disk.
+    """
+    SCORE_GROUPS = ('bite', 'bobber', 'water')
+    MAX_BYTES = 128 * 1024 * 1024 # Frame memory cap; fewer seconds are kept for large regions
+    KEEP = 10 # Dumps kept in directory; older ones are deleted
+
+    def __init__(self, seconds=10.0, max_fps=60, spots=1, regions=None, directory='logs'):
+        self.seconds = seconds
+        self.max_fps = max_fps
+        self.spots = spots
+        self.regions = regions # Spot regions relative to the frame, written to meta.json
+        self.directory = directory # Dumps go to <directory>/flight-<time>-<reason>
+        self.capacity = 0
+        self.count = 0 # Frames written since the start
+        self.frames = None
+        self.timestamps = None
+        self.scores = None
+        self._map = None
+        self._slot = -1 # Slot of the newest frame
+        self._events: deque = deque(maxlen=1000)
+        self._writer: Optional[threading.Thread] = None
+
+    def _allocate(self, frame):
+        self.capacity = max(1, min(int(self.seconds * self.max_fps), self.MAX_BYTES // frame.nbytes))
+        self._map = mmap.mmap(-1, self.capacity * frame.nbytes)
+        self.frames = np.frombuffer(self._map, dtype=frame.dtype).reshape((self.capacity,) + frame.shape)
+        self.timestamps = np.zeros(self.capacity, dtype=np.float64)
+        self.scores = np.full((self.capacity, self.spots, len(self.SCORE_GROUPS)), np.nan, dtype=np.float32)
+
+    def write(self, frame, timestamp):
+        """Keep frame, grabbed at timestamp, overwriting the oldest one."""
+        if self.frames is None:
+            self._allocate(frame)
+        elif frame.shape != self.frames.shape[1:]:
+            return
+        slot = self._slot = self.count % self.capacity
+        self.frames[slot] = frame
+        self.timestamps[slot] = timestamp
+        self.scores[slot] = np.nan
+        self.count += 1
+
+    def score(self, spot, group, value):
+        """Note the best score of group for spot on the newest frame."""
+        if self._slot >= 0 and group in self.SCORE_GROUPS:
+            self.scores[self._slot, spot, self.SCORE_GROUPS.index(group)] = value
+
+    def event(self, spot, event, t, state=None, score=None, value=None):
+        self._events.append({'event': event, 't': t, 'spot': spot, 'state': state,
+                             'score': None if score is None else float(score),
+                             'value': None if value is None else float(value)})
+
+    def dump(self, reason):
+        """Start writing the ring to a new recording folder and return its path.
+
+        Returns None if the ring is empty or the last dump is still being
+        written.
+        """
+        kept = min(self.count, self.capacity)
+        if kept == 0:
+            return None
+        if self.writing:
+            print("Flight recorder is still writing the last dump; skipping this one")
+            return None
+        path = os.path.join(self.directory, time.strftime(f'flight-%Y%m%d-%H%M%S-{reason}'))
+        if os.path.exists(path):
+            path += f'-{self.count}' # Second dump within the same second
+        os.makedirs(path, exist_ok=True)
+        # Oldest first: the slots after the newest one, then the rest. Only the small arrays are copied
+        # here; the writer thread copies the frames while the ring goes on
+        order = np.roll(np.arange(self.capacity), -(self._slot + 1))[-kept:]
+        snapshot = (order, self.count, self.timestamps[order], self.scores[order], list(self._events))
+        self._writer = threading.Thread(target=self._write, name='flight-dump',
+                                        args=(path, reason, self.frames, snapshot))
+        self._writer.start() # Not a daemon: a dump in progress at exit is finished
+        return path
+
+    @property
+    def writing(self):
+        return self._writer is not None and self._writer.is_alive()
+
+    def wait(self, timeout=None):
+        """Block until the dump in progress, if any, is written."""
+        if self._writer is not None:
+            self._writer.join(timeout)
+
+    def _write(self, path, reason, ring, snapshot):
+        order, count, timestamps, scores, events = snapshot
+        frames = np.empty((len(order),) + ring.shape[1:], dtype=ring.dtype)
+        for index, slot in enumerate(order): # One frame at a time, so the loop thread gets the GIL in between
+            frames[index] = ring[slot]
+        # The ring overwrites its oldest slots first; drop the frames it reached during the copy,
+        # plus one that may have been mid-write
+        overwritten = self.count - count
+        if overwritten:
+            skip = overwritten + 1
+            if skip >= len(frames):
+                print("Flight recorder was overwritten while being copied; dump dropped")
+                shutil.rmtree(path, ignore_errors=True)
+                return
+            frames, timestamps, scores = frames[skip:], timestamps[skip:], scores[skip:]
+        kept = len(frames)
+        meta = {
+            'version': 1,
+            'shape': list(frames.shape[1:]),
+            'count': kept,
+            'chunks': [kept],
+            'started': time.time() - (time.perf_counter() - timestamps[0]),
+            'flight': {'reason': reason, 'score_groups': list(self.SCORE_GROUPS), 'spots': self.regions},
+        }
+        try:
+            np.save(os.path.join(path, 'frames-00000.npy'), frames)
+            np.save(os.path.join(path, 'timestamps.npy'), timestamps)
+            np.save(os.path.join(path, 'scores.npy'), scores)
+            with open(os.path.join(path, 'events.json'), 'w') as f:
+                json.dump([e for e in events if e['t'] >= timestamps[0]], f, indent=1)
+            with open(os.path.join(path, 'meta.json'), 'w') as f: # Last, so a folder with meta.json is complete
+                json.dump(meta, f, indent=1)
+        except OSError as e:
+            print(f"Error writing flight recorder: {e}")
+        # Names sort by time; keep the newest KEEP
+        for old in sorted(glob.glob(os.path.join(self.directory, 'flight-*')))[:-self.KEEP]:
+            shutil.rmtree(old, ignore_errors=True)
+
+    def close(self):
+        """Release the frame memory."""
+        self.frames = None
+        self._map = None # Unmapped once the last view is gone
+
+LEDGER_FILE = os.path.join('logs', 'ledger.sqlite3') # Session events of every run, see SessionLedger
+
+class SessionLedger(threading.Thread):
+    """Append-only SQLite log of every session's state transitions.
+
+    Tables:
+      runs    one row per macro run: wall-clock start and end, settings as JSON
+      events  one row per transition: run, spot, wall-clock time, event, the
+              state it led to, the deciding detector score and an event value
+              (e.g. seconds from cast to bite)
+    record() only queues a row; this thread writes them in batches, so the
+    macro thread never waits on the disk. Times passed in are on clock and
+    are stored as wall-clock seconds.
+    """
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS runs (id INTEGER PRIMARY KEY, started REAL, ended REAL, settings TEXT);
+        CREATE TABLE IF NOT EXISTS events (run INTEGER, spot TEXT, t REAL, event TEXT, state TEXT,
+                                           score REAL, value REAL);
+        CREATE INDEX IF NOT EXISTS events_run ON events (run, spot);
+    """
+    BATCH = 256 # Most rows per transaction
+    FLUSH_INTERVAL = 1.0 # Seconds a row may wait before its batch is written
+
+    def __init__(self, path, settings=None, clock=time.perf_counter):
+        super().__init__(name='ledger', daemon=True)
+        self.path = path
+        self.settings = settings or {}
+        self.clock = clock
+        self.run_id: Optional[int] = None
+        self.failed = False # Set if the database could not be written; rows are dropped from then on
+        self._epoch = time.time() - clock() # Adds to a clock time to give wall-clock time
+        self._started_at = time.time()
+        self._ended_at = None
+        self._queue = queue.SimpleQueue()
+
+    def record(self, spot, event, t, state=None, score=None, value=None):
+        """Queue one event at clock time t; safe from any thread."""
+        if self.failed:
+            return
+        self._queue.put((spot, t + self._epoch, event, state,
+                         None if score is None else float(score), None if value is None else float(value)))
+
+    def run(self):
+        try:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            db = sqlite3.connect(self.path)
+        except (OSError, sqlite3.Error) as e:
+            print(f"Error opening session ledger: {e}")
+            self.failed = True
+            return
+        try:
+            db.executescript(self.SCHEMA)
+            self.run_id = db.execute('INSERT INTO runs (started, settings) VALUES (?, ?)',
+                                     (self._started_at, json.dumps(self.settings))).lastrowid
+            db.commit()
+            done = False
+            while not done:
+                batch = []
+                deadline = time.monotonic() + self.FLUSH_INTERVAL
+                while len(batch) < self.BATCH:
+                    try:
+                        row = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                    except queue.Empty:
+                        break
+                    if row is None:
+                        done = True
+                        break
+                    batch.append((self.run_id,) + row)
+                if batch:
+                    db.executemany('INSERT INTO events VALUES (?, ?, ?, ?, ?, ?, ?)', batch)
+                    db.commit()
+            db.execute('UPDATE runs SET ended = ? WHERE id = ?', (self._ended_at, self.run_id))
+            db.commit()
+        except sqlite3.Error as e:
+            print(f"Error writing session ledger: {e}")
+            self.failed = True
+        finally:
+            db.close()
+
+    def close(self):
+        """Write everything queued, mark the run finished and wait for the thread."""
+        self._ended_at = self.clock() + self._epoch
+        self._queue.put(None)
+        if self.is_alive():
+            self.join(timeout=5)
+
+def ledger_summary(path, run=None) -> List[dict]:
+    """Throughput and failure rates per run and per spot of a run, from a SessionLedger database."""
+    db = sqlite3.connect(path)
+    try:
+        rows = []
+        for keys in ('run', 'run, spot'):
+            query = f"""
+                SELECT run, {'spot' if 'spot' in keys else 'NULL'}, MIN(t), MAX(t),
+                       SUM(event = 'cast'), SUM(event = 'reel'), SUM(event = 'bite_ignored'),
+                       SUM(event = 'bobber_missed'), SUM(event = 'bobber_lost'), SUM(event = 'recovered'),
+                       SUM(event = 'position_lost'), SUM(event = 'relocated'), SUM(event = 'afk'), SUM(event = 'error'),
+                       AVG(CASE WHEN event = 'reel' THEN value END), AVG(CASE WHEN event = 'bobber' THEN value END),
+                       AVG(CASE WHEN event = 'recovered' THEN value END),
+                       TOTAL(CASE WHEN event IN ('recovered', 'position_lost') THEN value END)
+                FROM events {'WHERE run = ?' if run is not None else ''}
+                GROUP BY {keys} ORDER BY {keys}"""
+            for (run_id, spot, first, last, casts, reels, ignored, missed, lost, recovered, position_lost,
+                 relocated, afk, errors, to_bite, to_bobber, recovery, paused) in db.execute(query, () if run is None else (run,)):
+                hours = (last - first) / 3600
+                rows.append({
+                    'run': run_id, 'spot': spot, 'started': first, 'hours': hours,
+                    'casts': casts, 'reels': reels, 'bites_ignored': ignored, 'bobber_missed': missed,
+                    'bobber_lost': lost, 'recoveries': recovered, 'position_lost': position_lost, 'relocated': relocated,
+                    'afk_moves': afk, 'errors': errors,
+                    'casts_per_hour': casts / hours if hours > 0 else 0.0,
+                    'reels_per_hour': reels / hours if hours > 0 else 0.0,
+                    'reel_rate': reels / casts if casts else 0.0,
+                    'failure_rate': (missed + lost) / casts if casts else 0.0,
+                    'mean_time_to_bite': to_bite, 'mean_time_to_bobber': to_bobber,
+                    'mean_recovery': recovery, 'paused_seconds': paused,
+                })
+        rows.sort(key=lambda row: (row['run'], row['spot'] is not None, row['spot'] or ''))
+        return rows
+    finally:
+        db.close()
+
+CAPTURE_BACKENDS = ('auto', 'mss', 'pyautogui')
+
+class Timer:
+    """A callback scheduled on an EventLoop; cancel() drops it if it has not fired yet."""
+    def __init__(self, when, callback, args):
+        self.when = when
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+class EventLoop:
+    """Condition-variable event loop: cancellable timers and posted callbacks on one thread.
+
+    post() and stop() may be called from any thread and wake the loop at
+    once. Deadlines are read from clock, so a replay can fire the same
+    timers at recorded timestamps by calling run_due() itself.
+    """
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self._cond = threading.Condition()
+        self._timers = [] # Heap of (when, order, Timer)
+        self._order = 0
+        self._posted = []
+        self._stopped = False
+
+    def call_at(self, when, callback, *args) -> Timer:
+        timer = Timer(when, callback, args)
+        with self._cond:
+            self._order += 1
+            heapq.heappush(self._timers, (when, self._order, timer))
+            self._cond.notify()
+        return timer
+
+    def call_later(self, delay, callback, *args) -> Timer:
+        return self.call_at(self.clock() + delay, callback, *args)
+
+    def post(self, callback, *args):
+        """Run callback(*args) on the loop thread soon; a call already pending is not queued twice."""
+        with self._cond:
+            if (callback, args) not in self._posted:
+                self._posted.append((callback, args))
+            self._cond.notify()
+
+    @property
+    def stopped(self):
+        return self._stopped
+
+    def stop(self):
+        """Make run() return after the callback it is running, dropping pending timers."""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+
+    def run_due(self, now=None) -> Optional[float]:
+        """Run posted callbacks and timers due by now; return the next deadline, if any."""
+        if now is None:
+            now = self.clock()
+        with self._cond:
+            posted, self._posted = self._posted, []
+        for callback, args in posted:
+            if self._stopped:
+                return None
+            callback(*args)
+        while not self._stopped:
+            with self._cond:
+                while self._timers and self._timers[0][2].cancelled:
+                    heapq.heappop(self._timers)
+                if not self._timers or self._timers[0][0] > now:
+                    return self._timers[0][0] if self._timers else None
+                timer = heapq.heappop(self._timers)[2]
+            timer.callback(*timer.args)
+        return None
+
+    def run(self):
+        """Dispatch callbacks and timers until stop()."""
+        while not self._stopped:
+            deadline = self.run_due()
+            with self._cond:
+                if self._posted or self._stopped:
+                    continue
+                timeout = None if deadline is None else max(0.0, deadline - self.clock())
+                self._cond.wait(timeout)
+
+class UiChannel:
+    """Latest-value slots that macro threads write and the Tk thread polls.
+
+    put() stores a (sequence, value) pair in a dict slot, so writers never
+    touch Tk and repeated writes between two polls collapse into the last
+    one. There are writers on several threads (the macro thread, and the Tk
+    thread itself), so numbering and storing happen under one short lock:
+    otherwise a lower number could be stored after a poll had moved past it
+    and that write would never be seen.
+    """
+    def __init__(self):
+        self._slots = {}
+        self._sequence = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def put(self, key, value):
+        with self._lock:
+            self._slots[key] = (next(self._sequence), value)
+
+    def changes(self, since=0) -> Tuple[int, Dict[str, object]]:
+        """Slots written after sequence number since, and the newest sequence number."""
+        with self._lock:
+            slots = dict(self._slots)
+        latest = max([seq for seq, _ in slots.values()], default=since)
+        return max(latest, since), {key: value for key, (seq, value) in slots.items() if seq > since}
+
+UI_REFRESH_HZ = 10 # How often the window renders the macro's status
+
+class LatestFrameBuffer:
+    """Single-producer, single-consumer frame ring with latest-frame-wins semantics.
+
+    The producer copies each frame into a preallocated slot that is neither
+    the newest frame nor the one the consumer is reading. Frames the consumer
+    never picked up are overwritten (and counted as dropped), never queued.
+    """
+    def __init__(self, slots=3):
+        self._slots = [None] * slots
+        self._stamps = [0.0] * slots
+        self._seqs = [0] * slots
+        self._latest = -1
+        self._reading = -1
+        self._seq = 0
+        self._consumed = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self.dropped = 0
+        self.on_change = None # Called after every publish() and on close(), e.g. to wake an EventLoop
+
+    def publish(self, frame, timestamp):
+        """Copy frame into a free slot and make it the latest."""
+        with self._cond:
+            index = next(i for i in range(len(self._slots)) if i != self._latest and i != self._reading)
+        # Safe to copy unlocked: the consumer only ever reads the latest slot
+        slot = self._slots[index]
+        if slot is None or slot.shape != frame.shape:
+            slot = self._slots[index] = np.empty_like(frame)
+        np.copyto(slot, frame)
+        with self._cond:
+            if self._latest >= 0 and self._seqs[self._latest] > self._consumed:
+                self.dropped += 1
+            self._seq += 1
+            self._seqs[index] = self._seq
+            self._stamps[index] = timestamp
+            self._latest = index
+            self._cond.notify_all()
+        if self.on_change is not None:
+            self.on_change()
+
+    def get(self, after_seq=0, timeout=None):
+        """Wait for a frame newer than after_seq; return (seq, timestamp, frame) or None.
+
+        The frame stays valid until the next call to get().
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._seq > after_seq or self._closed, timeout):
+                return None
+            if self._latest < 0 or self._seq <= after_seq:
+                return None # Closed
+            self._reading = self._latest
+            self._consumed = self._seqs[self._latest]
+            return self._consumed, self._stamps[self._latest], self._slots[self._latest]
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def close(self):
+        """Wake up any waiting consumer; get() returns None from now on."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self.on_change is not None:
+            self.on_change()
+
+class CaptureThread(threading.Thread):
+    """Producer: grabs frames from a FrameSource into a LatestFrameBuffer."""
+    def __init__(self, source, frames, max_fps=60, stats=None, recorder=None):
+        super().__init__(name='capture', daemon=True)
+        self.source = source
+        self.frames = frames
+        self.stats = stats
+        self.recorder = recorder # Optional FrameRecorder that keeps every grabbed frame
+        self.interval = 1.0 / max_fps if max_fps else 0.0
+        self._stop_event = threading.Event()
+        self._wake = threading.Event()
+
+    def run(self):
+        try:
+            while not self._stop_event.is_set():
+                started = time.perf_counter()
+                try:
+                    frame = self.source.grab()
+                except Exception as e:
+                    print(f"Error capturing frame: {e}")
+                    self._stop_event.wait(1) # Sleep on error to prevent rapid error logging
+                    continue
+                if frame is None:
+                    break # Recorded source ran out of frames
+                self.frames.publish(frame, started)
+                if self.recorder is not None:
+                    self.recorder.write(frame, started)
+                if self.stats is not None:
+                    self.stats.add('capture', self.source.grab_time)
+                    self.stats.add('convert', self.source.convert_time)
+                    self.stats.add('publish', time.perf_counter() - started - self.source.grab_time - self.source.convert_time)
+                # Re-check after set_interval() so a shorter interval takes effect at once
+                while not self._stop_event.is_set():
+                    remaining = self.interval - (time.perf_counter() - started)
+                    if remaining <= 0:
+                        break
+                    self._wake.wait(remaining)
+                    self._wake.clear()
+        finally:
+            # mss handles must be closed on the thread that used them
+            self.source.close()
+            self.frames.close()
+
+    def set_interval(self, seconds):
+        """Change the time between grabs, waking the thread if it is waiting."""
+        if seconds != self.interval:
+            self.interval = seconds
+            self._wake.set()
+
+    def stop(self):
+        self._stop_event.set()
+        self._wake.set()
+
+class InputBackend:
+    """Sends clicks and key presses; chosen once at startup by create_input_backend()."""
+    name = 'none'
+
+    def click(self, x, y):
+        raise NotImplementedError
+
+    def key_down(self, key):
+        raise NotImplementedError
+
+    def key_up(self, key):
+        raise NotImplementedError
+
+class PyAutoGUIBackend(InputBackend):
+    name = 'pyautogui'
+
+    def __init__(self):
+        # InputActor times its own steps; pyautogui's default 0.1 s sleep after every call would add to them
+        if pyautogui: # Imports it, so the name below is the module itself
+            pyautogui.PAUSE = 0
+
+    def click(self, x, y):
+        pyautogui.click(x, y)
+
+    def key_down(self, key):
+        pyautogui.keyDown(key)
+
+    def key_up(self, key):
+        pyautogui.keyUp(key)
+
+class DirectInputBackend(PyAutoGUIBackend):
+    """Keys through pydirectinput (scan codes, which games read on Windows); clicks through pyautogui."""
+    name = 'directinput'
+
+    def __init__(self):
+        super().__init__()
+        if pydirectinput:
+            pydirectinput.PAUSE = 0 # Same 0.1 s default as pyautogui
+
+    def key_down(self, key):
+        pydirectinput.keyDown(key)
+
+    def key_up(self, key):
+        pydirectinput.keyUp(key)
+
+class RecordingBackend(InputBackend):
+    """Null backend for headless runs: sends nothing, keeps (time, kind, args) of every call."""
+    name = 'record'
+
+    def __init__(self, limit=10000):
+        self.events = deque(maxlen=limit)
+
+    def click(self, x, y):
+        self.events.append((time.perf_counter(), 'click', (x, y)))
+
+    def key_down(self, key):
+        self.events.append((time.perf_counter(), 'key_down', (key,)))
+
+    def key_up(self, key):
+        self.events.append((time.perf_counter(), 'key_up', (key,)))
+
+INPUT_BACKENDS = ('auto', 'pyautogui', 'directinput', 'record')
+
+def create_input_backend(name='auto') -> InputBackend:
+    """Resolve the input backend once: pydirectinput keys on Windows, pyautogui elsewhere."""
+    if name == 'auto':
+        if platform.system() == "Windows" and pydirectinput:
+            name = 'directinput'
+        elif pyautogui:
+            name = 'pyautogui'
+        else:
+            print("No input library available; clicks and key presses will only be recorded")
+            name = 'record'
+    if name == 'directinput':
+        return DirectInputBackend()
+    if name == 'pyautogui':
+        return PyAutoGUIBackend()
+    return RecordingBackend()
+
+KEY_HOLD = 0.02 # Seconds each movement key is held down
+
+def click_steps(point):
+    """Input steps for one click at point."""
+    return [(0.0, 'click', tuple(point))]
+
+def key_taps(keys, hold=KEY_HOLD):
+    """Input steps that tap each key in turn, holding it for hold seconds."""
+    steps = []
+    for index, key in enumerate(keys):
+        steps.append((index * hold, 'key_down', (key,)))
+        steps.append(((index + 1) * hold, 'key_up', (key,)))
+    return steps
+
+class ActionTicket:
+    """Handle for a queued input action; set once its first step has been issued."""
+    def __init__(self):
+        self.issued_at: Optional[float] = None # time.perf_counter() when the first step went out
+        self.step_times: List[float] = [] # When each step actually went out
+        self._done = threading.Event()
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+class InputActor(threading.Thread):
+    """Input dispatcher: issues queued clicks and key sequences on its own thread.
+
+    An action is a list of (offset, kind, args) steps, each run as
+    backend.<kind>(*args) at a precise offset from the action's start.
+    Actions run strictly in order, so a reel and the following cast never
+    interleave; urgent ones (reels) go ahead of anything still queued.
+    settle is an extra pause after an action before the next one; stop()
+    cuts it short and drops anything still queued.
+    """
+    SPIN = 0.002 # Busy-wait the last stretch before a deadline instead of trusting the OS sleep
+
+    def __init__(self, backend, stats=None):
+        super().__init__(name='input', daemon=True)
+        self.backend = backend
+        self.stats = stats # Optional LatencyStats for how late steps go out
+        self._queue = queue.PriorityQueue()
+        self._order = 0
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+
+    def submit(self, steps, settle=0.0, on_issued=None, label=None, at=None, urgent=False) -> ActionTicket:
+        """Queue steps to start at perf_counter time at (default: as soon as possible).
+
+        on_issued(issue_time) is called right after the first step goes out.
+        """
+        ticket = ActionTicket()
+        with self._lock:
+            self._order += 1
+            order = self._order
+        self._queue.put((0 if urgent else 1, order, (steps, settle, at, ticket, on_issued, label)))
+        return ticket
+
+    def click(self, point, **kwargs) -> ActionTicket:
+        return self.submit(click_steps(point), **kwargs)
+
+    def _wait_until(self, deadline):
+        """Sleep until deadline, spinning for the last SPIN seconds; False if stopped meanwhile."""
+        while True:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                return True
+            if remaining > self.SPIN:
+                if self._stop_event.wait(remaining - self.SPIN):
+                    return False
+            elif self._stop_event.is_set():
+                return False
+
+    def run(self):
+        while True:
+            _, _, item = self._queue.get()
+            if item is None or self._stop_event.is_set():
+                break
+            steps, settle, at, ticket, on_issued, label = item
+            start = time.perf_counter() if at is None else at
+            for offset, kind, args in steps:
+                if not self._wait_until(start + offset):
+                    return
+                try:
+                    getattr(self.backend, kind)(*args)
+                except Exception as e:
+                    print(f"Error sending input ({label or kind}): {e}")
+                issued = time.perf_counter()
+                ticket.step_times.append(issued)
+                if self.stats is not None:
+                    self.stats.add('input_late', max(0.0, issued - start - offset))
+                if ticket.issued_at is None:
+                    ticket.issued_at = issued
+                    ticket._done.set()
+                    if on_issued is not None:
+                        on_issued(issued)
+            if ticket.issued_at is None: # No steps
+                ticket.issued_at = time.perf_counter()
+                ticket._done.set()
+            if settle:
+                self._stop_event.wait(settle)
+
+    def stop(self):
+        """Exit after the step in progress, dropping queued actions."""
+        self._stop_event.set()
+        self._queue.put((-1, 0, None))
+
+class BobberTracker:
+    """Remembers where the bobber last matched so later frames search a small window.
+
+    The window is centred on the last bobber match and sized to fit the
+    largest template plus some padding. Tracking is dropped (full-region
+    search) when the score falls below min_score or after max_frames frames.
+    """
+    def __init__(self, padding=40, max_frames=60, min_score=0.7):
+        self.padding = padding
+        self.max_frames = max_frames
+        self.min_score = min_score
+        self.center: Optional[Tuple[int, int]] = None
+        self.frames_tracked = 0
+
+    def reset(self):
+        """Forget the last location so the next search covers the whole region."""
+        self.center = None
+        self.frames_tracked = 0
+
+    def update(self, score, loc, size):
+        """Record a bobber match at loc (top-left, frame coordinates) of the given size."""
+        if score < self.min_score:
+            self.reset()
+            return
+        self.center = (loc[0] + size[0] // 2, loc[1] + size[1] // 2)
+
+    def window(self, frame_shape, max_size):
+        """Return (x0, y0, x1, y1) to search, or None for a full-region search."""
+        if self.center is None or self.frames_tracked >= self.max_frames:
+            self.reset()
+            return None
+        self.frames_tracked += 1
+        height, width = frame_shape[:2]
+        half_w = max_size[0] // 2 + self.padding
+        half_h = max_size[1] // 2 + self.padding
+        cx, cy = self.center
+        x0, y0 = max(0, cx - half_w), max(0, cy - half_h)
+        x1, y1 = min(width, cx + half_w), min(height, cy + half_h)
+        if x1 - x0 >= width and y1 - y0 >= height:
+            return None # Window already covers the whole region
+        return x0, y0, x1, y1
+
+def create_frame_source(region, backend='auto', frames_path=None) -> FrameSource:
+    """Pick a frame source: recorded frames if given, else the fastest grabber available."""
+    if frames_path:
+        return FileFrameSource(frames_path, region)
+    if backend == 'mss' or (backend == 'auto' and mss):
+        if not mss:
+            raise RuntimeError("mss is not installed; use --capture pyautogui")
+        return MssFrameSource(region)
+    return PyAutoGUIFrameSource(region)
+
+class Spot:
+    """A fishing spot picked on the overlay: vision region, cast/reel click point and character position."""
+    def __init__(self, region, click_point, character_point):
+        self.region = region # (left, top, width, height), screen coordinates
+        self.click_point = click_point
+        self.character_point = character_point
+
+def bounding_region(regions):
+    """Smallest (left, top, width, height) that contains all regions."""
+    left = min(r[0] for r in regions)
+    top = min(r[1] for r in regions)
+    right = max(r[0] + r[2] for r in regions)
+    bottom = max(r[1] + r[3] for r in regions)
+    return left, top, right - left, bottom - top
+
+SPOT_PYRAMID = os.path.join('cache', 'pyramid-{scale:.2f}.npz') # SpotLocator templates, one file per display scale
+
+class SpotLocator:
+    """Finds a fishing spot on a full-screen grab: the water to fish in and the bobber on it.
+
+    The water and bobber templates are resized for a range of zooms around
+    the display scale, at full resolution and at COARSE resolution, and kept
+    in one .npz per display scale that is rebuilt when the assets change.
+    locate() matches the coarse pyramid against a COARSE grayscale copy of
+    the screen to find candidates at every zoom, then confirms the best ones
+    in colour at full resolution in small windows around them.
+    """
+    PYRAMID_FORMAT = 1
+    GROUPS = ('water', 'bobber')
+    ZOOMS = (0.75, 0.875, 1.0, 1.125, 1.25, 1.5) # Relative to the display scale; the game view may be zoomed too
+    COARSE = 0.25
+    MIN_COARSE_SIZE = 8 # Templates smaller than this at COARSE are only matched in the fine stage
+    PEAKS = 3 # Coarse peaks kept per template and zoom
+    CANDIDATES = 24 # Best coarse peaks per group confirmed at full resolution
+    REGION_SCALE = 4 # Region size in multiples of the largest bobber/bite template
+
+    def __init__(self, bank, display_scale=1.0, cache_path=None, configs=None):
+        self.bank = bank
+        self.display_scale = display_scale
+        self.cache_path = cache_path
+        configs = configs or match_configs()
+        self.thresholds = {'bobber': configs['bobber'].threshold('found'),
+                           'water': configs['water'].threshold('after_loss')}
+        self.version = bank.version # Rebuild when the bank reloads
+        self.from_cache = False
+        self.last: Dict[str, object] = {} # Details of the last locate(): seconds, group, score, zoom
+        manifest = None
+        if cache_path:
+            manifest = {'format': self.PYRAMID_FORMAT, 'display_scale': display_scale, 'zooms': list(self.ZOOMS),
+                        'coarse': self.COARSE, 'assets': bank._manifest()}
+        self.pyramid = self._load(manifest) if manifest and os.path.exists(cache_path) else None
+        self.from_cache = self.pyramid is not None
+        if self.pyramid is None:
+            self.pyramid = self._build()
+            if manifest:
+                self._save(manifest)
+
+    def _build(self) -> Dict[tuple, list]:
+        """(group, zoom) -> [(name, full-resolution BGR, COARSE grayscale or None), ...]"""
+        pyramid = {}
+        for group in self.GROUPS:
+            for zoom in self.ZOOMS:
+                scale = self.display_scale * zoom
+                entries = []
+                for template in self.bank.get(group):
+                    width, height = template.size
+                    fine = cv2.resize(template.image, (max(1, round(width * scale)), max(1, round(height * scale))),
+                                      interpolation=cv2.INTER_AREA if scale < 1.0 else cv2.INTER_LINEAR)
+                    small = scale * self.COARSE
+                    coarse = None
+                    if min(width, height) * small >= self.MIN_COARSE_SIZE:
+                        coarse = cv2.resize(template.gray, (round(width * small), round(height * small)),
+                                            interpolation=cv2.INTER_AREA)
+                    entries.append((template.name, fine, coarse))
+                pyramid[(group, zoom)] = entries
+        return pyramid
+
+    def _load(self, manifest) -> Optional[Dict[tuple, list]]:
+        try:
+            with np.load(self.cache_path, allow_pickle=False) as bundle:
+                if json.loads(str(bundle['manifest'])) != manifest:
+                    return None # Assets or settings changed since the pyramid was written
+                pyramid = {}
+                for group in self.GROUPS:
+                    for zoom in self.ZOOMS:
+                        entries = []
+                        for name, _ in manifest['assets']['groups'][group]:
+                            key = f'{group}/{zoom}/{name}'
+                            entries.append((name, bundle[f'{key}/fine'],
+                                            bundle[f'{key}/coarse'] if f'{key}/coarse' in bundle.files else None))
+                        pyramid[(group, zoom)] = entries
+                return pyramid
+        except (OSError, KeyError, ValueError) as e:
+            print(f"Ignoring template pyramid {self.cache_path}: {e}")
+            return None
+
+    def _save(self, manifest):
+        arrays = {'manifest': np.array(json.dumps(manifest))}
+        for (group, zoom), entries in self.pyramid.items():
+            for name, fine, coarse in entries:
+                arrays[f'{group}/{zoom}/{name}/fine'] = fine
+                if coarse is not None:
+                    arrays[f'{group}/{zoom}/{name}/coarse'] = coarse
+        try:
+            folder = os.path.dirname(self.cache_path)
+            if folder:
+                os.makedirs(folder, exist_ok=True)
+            temp = self.cache_path + '.tmp'
+            with open(temp, 'wb') as f:
+                np.savez_compressed(f, **arrays)
+            os.replace(temp, self.cache_path)
+        except OSError as e:
+            print(f"Error writing template pyramid {self.cache_path}: {e}")
+
+    @staticmethod
+    def _peaks(scores, count, size):
+        """Up to count (score, x, y) maxima of a result map at least one template size apart."""
+        peaks = []
+        height, width = size
+        for _ in range(count):
+            _, best, _, (x, y) = cv2.minMaxLoc(scores)
+            if best <= 0:
+                break
+            peaks.append((best, x, y))
+            scores[max(0, y - height // 2):y + height // 2 + 1, max(0, x - width // 2):x + width // 2 + 1] = -1.0
+        return peaks
+
+    def _confirm(self, screen, group, zoom, x, y):
+        """Best full-resolution (score, left, top, width, height) of group at zoom around (x, y)."""
+        margin = int(round(2 / self.COARSE))
+        best = None
+        for _, fine, _ in self.pyramid[(group, zoom)]:
+            height, width = fine.shape[:2]
+            left, top = max(0, int(x) - margin), max(0, int(y) - margin)
+            window = screen[top:int(y) + height + margin, left:int(x) + width + margin]
+            if window.shape[0] < height or window.shape[1] < width:
+                continue
+            _, score, _, (dx, dy) = cv2.minMaxLoc(cv2.matchTemplate(window, fine, cv2.TM_CCOEFF_NORMED))
+            if best is None or score > best[0]:
+                best = (score, left + dx, top + dy, width, height)
+        return best
+
+    def locate(self, screen, origin=(0, 0), layout=None) -> Optional[Spot]:
+        """Propose a Spot on screen (a BGR grab whose top-left is at origin), or None without water.
+
+        The click point goes on the bobber if one is visible, else on the
+        water nearest the character: the old spot's character with a layout
+        to recover, else the middle of the screen, where the game keeps the
+        player. A layout also keeps its character offset, which decides the
+        AFK moves.
+        """
+        start = time.perf_counter()
+        screen_height, screen_width = screen.shape[:2]
+        gray = cv2.cvtColor(screen, cv2.COLOR_BGR2GRAY)
+        coarse = cv2.resize(gray, None, fx=self.COARSE, fy=self.COARSE, interpolation=cv2.INTER_AREA)
+
+        # Coarse stage: peaks of every template at every zoom
+        candidates = {group: [] for group in self.GROUPS}
+        for (group, zoom), entries in self.pyramid.items():
+            for _, _, small in entries:
+                if small is None or small.shape[0] > coarse.shape[0] or small.shape[1] > coarse.shape[1]:
+                    continue
+                scores = cv2.matchTemplate(coarse, small, cv2.TM_CCOEFF_NORMED)
+                for score, x, y in self._peaks(scores, self.PEAKS, small.shape):
+                    candidates[group].append((score, zoom, x / self.COARSE, y / self.COARSE))
+
+        # Fine stage: confirm the best candidates in colour
+        found = {group: [] for group in self.GROUPS}
+        for group, peaks in candidates.items():
+            for _, zoom, x, y in sorted(peaks, reverse=True)[:self.CANDIDATES]:
+                match = self._confirm(screen, group, zoom, x, y)
+                if match is not None and match[0] > self.thresholds[group]:
+                    found[group].append((zoom,) + match)
+
+        if layout is not None:
+            character = (layout.character_point[0] - origin[0], layout.character_point[1] - origin[1])
+        else:
+            character = (screen_width // 2, screen_height // 2)
+        if found['bobber']:
+            zoom, score, left, top, width, height = max(found['bobber'], key=lambda m: m[1])
+            group = 'bobber'
+        elif found['water']:
+            # Nearest water to the character, as a player would cast
+            zoom, score, left, top, width, height = min(
+                found['water'], key=lambda m: (m[2] + m[4] / 2 - character[0]) ** 2 + (m[3] + m[5] / 2 - character[1]) ** 2)
+            group = 'water'
+        else:
+            self.last = {'seconds': time.perf_counter() - start, 'group': None}
+            return None
+        click = (int(left + width // 2), int(top + height // 2))
+
+        # Region: room for the largest bobber/bite sprite around the click point, kept on screen
+        scale = self.display_scale * zoom
+        sprites = [t.size for g in ('bobber', 'bite') for t in self.bank.get(g)] or [(width, height)]
+        region_width = min(screen_width, int(max(w for w, _ in sprites) * scale * self.REGION_SCALE))
+        region_height = min(screen_height, int(max(h for _, h in sprites) * scale * self.REGION_SCALE))
+        region_left = min(max(0, click[0] - region_width // 2), screen_width - region_width)
+        region_top = min(max(0, click[1] - region_height // 2), screen_height - region_height)
+
+        if layout is not None:
+            character_point = (click[0] + layout.character_point[0] - layout.click_point[0] + origin[0],
+                               click[1] + layout.character_point[1] - layout.click_point[1] + origin[1])
+        else:
+            character_point = (character[0] + origin[0], character[1] + origin[1])
+        self.last = {'seconds': time.perf_counter() - start, 'group': group, 'score': float(score), 'zoom': zoom}
+        return Spot((region_left + origin[0], region_top + origin[1], region_width, region_height),
+                    (click[0] + origin[0], click[1] + origin[1]), character_point)
+
+def grab_screen(backend='auto', frames_path=None) -> Tuple['np.ndarray', Tuple[int, int]]:
+    """One BGR frame of the primary screen and its top-left corner (the next recorded frame with frames_path)."""
+    if frames_path:
+        source = FileFrameSource(frames_path)
+        origin = (0, 0)
+    else:
+        if backend == 'mss' or (backend == 'auto' and mss):
+            with mss.mss() as sct:
+                monitor = sct.monitors[1]
+            region = (monitor['left'], monitor['top'], monitor['width'], monitor['height'])
+        else:
+            width, height = pyautogui.size()
+            region = (0, 0, width, height)
+        source = create_frame_source(region, backend)
+        origin = region[:2]
+    try:
+        return source.grab().copy(), origin
+    finally:
+        source.close()
 
-    return os.path.join(base_path, relative_path)
+class FishingSession:
+    """One fishing spot: its own state machine, counters and bite watcher.
+
+    step() is called with every new frame of the spot's region and never
+    blocks; every wait (bobber timeout, failure pause, error back-off, AFK
+    interval) is a timer on the EventLoop that drives it. Clicks and key
+    presses go through the (shared) input actor, so several sessions never
+    interleave mid-action. States:
+      cast -> casting -> wait_bobber -> watch -> cast ...
+      wait_bobber/watch failures -> pause -> cast, or stopped
+    During a pause the spot is sampled at RECOVERY_POLL and fishing resumes
+    as soon as the scene is stable again (see RecoveryMonitor), but not
+    before a hold that doubles with every pause since the last reel. With a
+    relocate callback, a pause that never settles goes to 'relocating'
+    instead of 'stopped' while the screen is searched for the spot (see
+    relocated()).
+    """
+    BOBBER_TIMEOUT = 1.0 # Seconds to wait for the bobber after a cast
+    BOBBER_POLL = 0.05 # Small delay between bobber checks to prevent high CPU during waiting
+    REEL_DEBOUNCE = 1.0 # Prevent rapid clicks: ignore bites this soon after the cast
+    REEL_SETTLE = 0.2 # Delay after reeling in
+    FOCUS_DELAY = 0.05 # Seconds between the focusing click and the first AFK key
+    MAX_FAILURES = 3
+    RECOVERY_HOLD = (1.0, 15.0) # Shortest pause, doubled per pause since the last reel up to the cap
+    RECOVERY_TIMEOUT = 15.0 # Seconds after the hold for the scene to settle before the position counts as lost
+    RECOVERY_POLL = 0.25 # Seconds between samples while paused
+    ERROR_BACKOFF = 1.0 # Pause after an unexpected error to prevent rapid error logging
+
+    def __init__(self, spot, detector, actor, name='', diff_threshold=12, stats=None, recorder=None,
+                 on_status=None, afk_interval=(3 * 60, 5 * 60), scheduler=None, loop=None, ledger=None,
+                 flight=None, spot_index=0, relocate=None, bite_trigger='temporal', confirmations=None,
+                 focus=False, pauses=0):
+        self.spot = spot
+        self.name = name # Prefixed to status messages when running several spots
+        self.detector = detector
+        self.actor = actor
+        self.watcher = BiteWatcher(detector, diff_threshold=diff_threshold, trigger=bite_trigger,
+                                   confirmations=confirmations)
+        self.stats = stats
+        self.recorder = recorder
+        self.ledger = ledger # Optional SessionLedger that logs every transition
+        self.flight = flight # Optional FlightRecorder shared by all spots; this spot's scores go to spot_index
+        self.spot_index = spot_index
+        self.relocate = relocate # Called with the session when its position is lost, to search for it again
+        self.focus = focus # Click this spot's client before AFK keys, which go to the foreground window
+        self.on_status = on_status
+        self.afk_interval = afk_interval
+        self.scheduler = scheduler # Optional PollScheduler that learns bite times
+        self.loop = loop or EventLoop() # Whoever steps the session must also run the loop's timers
+        self.state = 'cast'
+        self.failures = 0 # Consecutive bobber failures
+        self.counters = {'casts': 0, 'bites': 0, 'bobber_missed': 0, 'bobber_lost': 0,
+                         'recoveries': 0, 'afk_moves': 0, 'errors': 0}
+        self.stop_reason: Optional[str] = None
+        self._cast: Optional[ActionTicket] = None
+        self._cast_at = 0.0 # When the last cast went out
+        self._timer: Optional[Timer] = None # Bobber timeout or failure pause
+        self._next_poll = 0.0
+        self.recovery = RecoveryMonitor(detector.threshold('bobber', 'present'), detector.threshold('water', 'after_miss'))
+        self._pauses = pauses # Pauses since the last reel, for the back-off; carried over a relocation restart
+        self._hold = 0.0 # Shortest duration of the current pause
+        self._suspended = False # Backing off after an error
+        self._motion_at = float('-inf') # When the frame gate last saw motion while watching
+        self._afk_due = False
+        self._afk_timer = self._schedule_afk()
+        self._paused_at = 0.0
+        self.log('start', self.loop.clock())
+
+    @property
+    def stopped(self):
+        return self.state == 'stopped'
+
+    def status(self, text):
+        if self.on_status is not None:
+            self.on_status(f"{self.name}{text}")
+
+    def mark(self, event, timestamp, **fields):
+        if self.recorder is not None:
+            self.recorder.mark(event, timestamp, spot=self.name.strip(': ') or None, **fields)
+
+    def log(self, event, now, score=None, value=None):
+        """Add event at loop time now to the ledger, with the state it led to."""
+        spot = self.name.strip(': ') or 'Spot 1'
+        if self.ledger is not None:
+            self.ledger.record(spot, event, now, self.state, score, value)
+        if self.flight is not None:
+            self.flight.event(spot, event, now, self.state, score, value)
+
+    def _scored(self, results):
+        """Note detector results on the flight recorder."""
+        if self.flight is not None:
+            for group, result in results.items():
+                self.flight.score(self.spot_index, group, result.score)
+
+    def dump_flight(self, reason):
+        """Save the flight recorder's recent frames after the spot lost its position."""
+        if self.flight is None:
+            return None
+        try:
+            path = self.flight.dump(reason)
+        except OSError as e:
+            print(f"Error writing flight recorder: {e}")
+            return None
+        if path:
+            print(f"{self.name}Saving flight recorder to {path}")
+        return path
+
+    @property
+    def next_afk_at(self):
+        """Loop time of the next AFK move."""
+        return self._afk_timer.when
+
+    def _schedule_afk(self) -> Timer:
+        def due():
+            self._afk_due = True # Taken at the next cast
+        return self.loop.call_later(random.randint(*self.afk_interval), due)
+
+    def _set_timer(self, when, callback):
+        """Replace the pending state timer."""
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = self.loop.call_at(when, callback)
+
+    def close(self):
+        """Cancel the session's timers; the ledger's 'stop' event gets the share of frames the change gate skipped."""
+        for timer in (self._timer, self._afk_timer):
+            if timer is not None:
+                timer.cancel()
+        gate = self.watcher.gate
+        self.log('stop', self.loop.clock(), value=gate.skipped / gate.frames if gate.frames else None)
+
+    def step(self, frame, stamp, now=None):
+        """Advance the state machine with a frame grabbed at stamp (loop clock time)."""
+        if self._suspended:
+            return
+        if now is None:
+            now = self.loop.clock()
+        try:
+            getattr(self, f'_step_{self.state}')(frame, stamp, now)
+        except Exception as e:
+            print(f"Error in macro: {e}")
+            self.counters['errors'] += 1
+            self.log('error', now)
+            self._suspended = True
+            self.loop.call_later(self.ERROR_BACKOFF, setattr, self, '_suspended', False)
+
+    def poll_interval(self, now):
+        """Seconds this session is happy to wait for its next frame."""
+        scheduler = self.scheduler
+        if scheduler is None:
+            return 0.0
+        if self.state in ('pause', 'relocating', 'stopped'):
+            return scheduler.max_interval
+        if self.state == 'wait_bobber':
+            return self.BOBBER_POLL
+        if self.state == 'watch':
+            if now - self._motion_at < scheduler.motion_hold:
+                return scheduler.min_interval
+            return scheduler.bite_wait(now - self._cast_at, self.REEL_DEBOUNCE)
+        return scheduler.min_interval # Casting wants the next frame right away
+
+    def _step_stopped(self, frame, stamp, now):
+        pass
+
+    def _step_cast(self, frame, stamp, now):
+        # --- AFK Prevention Check ---
+        if self._afk_due:
+            self._afk_due = False
+            self.status("Moving to prevent AFK...")
+            steps = self.prevent_afk()
+            if self.focus:
+                # Clicking the character's own tile brings its client forward without moving it
+                steps = click_steps(self.spot.character_point) + [
+                    (offset + self.FOCUS_DELAY, kind, args) for offset, kind, args in steps]
+            self.actor.submit(steps, label='afk')
+            self.counters['afk_moves'] += 1
+            self.log('afk', now)
+            # Set the next random interval and AFK time
+            self._afk_timer = self._schedule_afk()
+            # After moving, it's safer to recast
+            self.status("AFK prevention done. Recasting...")
+            return
+
+        # --- Phase 1: Cast and wait for bobber to appear ---
+        self.status("Casting...")
+        self._cast = self.actor.click(self.spot.click_point, label='cast')
+        self.counters['casts'] += 1
+        self.state = 'casting'
+
+    def _step_casting(self, frame, stamp, now):
+        if self._cast.issued_at is None:
+            return # Still queued behind other input
+        self._cast_at = self._cast.issued_at
+        self.mark('cast', self._cast_at)
+        self.status("Casting... Detecting bobber.")
+        self._set_timer(self._cast_at + self.BOBBER_TIMEOUT, self._bobber_timeout)
+        self._next_poll = 0.0
+        self.state = 'wait_bobber'
+        self.log('cast', self._cast_at)
+
+    def _bobber_timeout(self):
+        if self.state != 'wait_bobber':
+            return
+        self.failures += 1
+        self.counters['bobber_missed'] += 1
+        self.status(f"Bobber not detected ({self.failures}/{self.MAX_FAILURES}).")
+        if self.failures >= self.MAX_FAILURES:
+            self._pause("Bobber not found. Pausing until the spot looks right...", 'after_miss', self.loop.clock())
+        else:
+            self.state = 'cast' # Re-cast
+        self.log('bobber_missed', self.loop.clock(), value=self.failures)
+
+    def _step_wait_bobber(self, frame, stamp, now):
+        if stamp < self._cast_at:
+            return # Grabbed before the cast went out
+        if now < self._next_poll:
+            return
+        results = self.detector.detect(frame, ('bobber',))
+        self._scored(results)
+        bobber = results['bobber']
+        if bobber.found(self.detector.threshold('bobber')):
+            self._timer.cancel()
+            self.watcher.start(bobber)
+            self.failures = 0 # Reset counter on success
+            self.status("Bobber present. Waiting for bite...")
+            self.state = 'watch'
+            self.log('bobber', now, bobber.score, stamp - self._cast_at)
+        else:
+            self._next_poll = now + self.BOBBER_POLL
+
+    def _step_watch(self, frame, stamp, now):
+        # --- Phase 2: Monitor for bite or bobber disappearance ---
+        results = self.watcher.analyze(frame)
+        if results is None:
+            return # Unchanged frame; the previous result still holds
+        detected_at = time.perf_counter()
+        self._scored(results)
+        if self.watcher.gate.motion:
+            self._motion_at = now
+
+        # Check for bite; one confirmed too soon after the cast is reeled once the debounce has passed
+        if self.watcher.bite(results, stamp, allowed=now - self._cast_at > self.REEL_DEBOUNCE):
+            self._reel(stamp, detected_at, results['bite'].score)
+        elif self.watcher.trigger.confirmed:
+            self.log('bite_ignored', now, results['bite'].score, now - self._cast_at)
+        elif self.watcher.pending:
+            pass # A bite is being confirmed; its sprite may hide the bobber
+        # If no bite, check if bobber is still present (lower confidence for presence check)
+        elif not self.watcher.bobber_present(results):
+            self.failures += 1
+            self.counters['bobber_lost'] += 1
+            self.status(f"Bobber disappeared ({self.failures}/{self.MAX_FAILURES}).")
+            if self.failures >= self.MAX_FAILURES:
+                self._pause("Bobber disappeared. Pausing until the spot looks right...", 'after_loss', now)
+            else:
+                self.state = 'cast' # Bobber is gone, re-cast
+            self.log('bobber_lost', now, results['bobber'].score, now - self._cast_at)
+        else:
+            self.failures = 0 # Reset counter on success
+
+    def _reel(self, seen_at, detected_at, score=None):
+        decided_at = time.perf_counter()
+        stats = self.stats
+        if stats is not None:
+            stats.add('decide', decided_at - detected_at)
+
+        def on_reel(issued_at):
+            if stats is not None:
+                stats.add('click', issued_at - decided_at)
+                stats.add('bite_to_click', issued_at - seen_at)
+        # Reel in, then let the game settle before the next cast
+        self.actor.click(self.spot.click_point, settle=self.REEL_SETTLE, on_issued=on_reel,
+                         label='reel', urgent=True)
+        self.mark('reel', seen_at)
+        if self.scheduler is not None:
+            self.scheduler.record_bite(seen_at - self._cast_at)
+        self.counters['bites'] += 1
+        self._pauses = 0 # Fishing works again; the next pause starts from the shortest hold
+        self.status("Bite detected! Reeling in...")
+        self.state = 'cast'
+        self.log('reel', seen_at, score, seen_at - self._cast_at)
+
+    def _pause(self, message, water_check, now):
+        self.status(message)
+        self.recovery.reset(self.detector.threshold('water', water_check)) # Which water threshold to verify with
+        shortest, cap = self.RECOVERY_HOLD
+        self._hold = min(cap, shortest * 2 ** self._pauses)
+        self._pauses += 1
+        self._next_poll = 0.0
+        self._paused_at = now
+        self.state = 'pause'
+        self.log('pause', now, value=self._hold)
+
+    def _step_pause(self, frame, stamp, now):
+        # Sample the spot at a low rate until it is stable again, or give up
+        if stamp < self._paused_at or now < self._next_poll:
+            return
+        self._next_poll = now + self.RECOVERY_POLL
+        results = self.detector.detect(frame, ('water', 'bobber'))
+        self._scored(results)
+        stable = self.recovery.update(frame, results)
+        elapsed = now - self._paused_at
+        if stable and elapsed >= self._hold:
+            # Water is present, continue fishing
+            self.status(f"Spot looks right again after {elapsed:.1f}s. Resuming fishing...")
+            self.counters['recoveries'] += 1
+            self.failures = 0 # Reset for the retry
+            self.state = 'cast'
+            self.log('recovered', now, self.recovery.presence, elapsed)
+        elif elapsed >= self._hold + self.RECOVERY_TIMEOUT:
+            # Water not found: search the screen for the spot, or stop it
+            if self.relocate is not None:
+                self.status("Position lost. Searching the screen for water...")
+                self.state = 'relocating'
+            else:
+                self.status("Position Lost! No water detected.")
+                self.stop_reason = 'position_lost'
+                self.state = 'stopped'
+            self.log('position_lost', now, self.recovery.presence, elapsed)
+            self.dump_flight('position_lost')
+            if self.relocate is not None:
+                self.relocate(self)
+
+    def _step_relocating(self, frame, stamp, now):
+        pass # Waiting for relocated()
+
+    def relocated(self, found, seconds):
+        """Finish a search started by relocate: found says whether the spot was found again."""
+        if self.state != 'relocating':
+            return
+        now = self.loop.clock()
+        if found:
+            self.status("Found the water again.")
+            self.log('relocated', now, value=seconds)
+        else:
+            self.status("Position Lost! No water detected.")
+            self.stop_reason = 'position_lost'
+            self.state = 'stopped'
+            self.log('relocate_failed', now, value=seconds)
+
+    def prevent_afk(self):
+        """Key steps for an intelligent, randomized move to prevent being flagged as AFK."""
+        # Determine primary direction and its opposite
+        char_x, char_y = self.spot.character_point
+        click_x, click_y = self.spot.click_point
+        delta_x = click_x - char_x
+        delta_y = click_y - char_y
+
+        if abs(delta_x) > abs(delta_y):  # Horizontal
+            if delta_x > 0:
+                facing_direction = 'right'
+                opposite_direction = 'left'
+            else:
+                facing_direction = 'left'
+                opposite_direction = 'right'
+        else:  # Vertical
+            if delta_y > 0:
+                facing_direction = 'down'
+                opposite_direction = 'up'
+            else:
+                facing_direction = 'up'
+                opposite_direction = 'down'
+        
+        # Randomly choose a movement pattern
+        move_patterns = [self._move_opposite, self._move_sideways]
+        chosen_move = random.choice(move_patterns)
+
+        if chosen_move == self._move_sideways:
+            return chosen_move(facing_direction)
+        return chosen_move(facing_direction, opposite_direction)
+
+    def _move_opposite(self, facing_direction, opposite_direction):
+        """Move one step opposite and immediately return, repeating 1-3 times."""
+        repeat_times = random.randint(1, 3)
+        return key_taps([opposite_direction, facing_direction] * repeat_times)
+
+    def _move_sideways(self, facing_direction):
+        """Move one step sideways and immediately return, with randomization."""
+        if facing_direction in ['up', 'down']:
+            side_keys = ['left', 'right']
+        else:
+            side_keys = ['up', 'down']
+        
+        random.shuffle(side_keys) # Randomize the order of movement
+        return key_taps(side_keys)
 
 class FishingMacro:
-    def __init__(self, root):
+    def __init__(self, root, capture_backend='auto', frames_path=None, diff_threshold=12,
+                 stats_path=None, record_path=None, match_mode='full', prefilter=False,
+                 detect_workers=0, max_fps=60, cpu_budget=1.0, input_backend='auto', calibration=None,
+                 startup_report=None, ledger_path=LEDGER_FILE, profile=None, flight_seconds=10.0,
+                 auto_locate=True, bite_trigger='temporal', confirmations=None):
         """Initialize the fishing macro application."""
         self.root = root
         self.root.title("Fishing Macro")
@@ -33,6 +2921,8 @@ class FishingMacro:
         self.click_point: Optional[Tuple[int, int]] = None
         self.character_point: Optional[Tuple[int, int]] = None
         self.character_marker_id: Optional[int] = None
+        self.spots: List[Spot] = [] # Confirmed selections; more than one runs several spots at once
+        self.sessions: List[FishingSession] = []
         self.running: bool = False
         self.overlay = None
         self.last_afk_prevent_time: Optional[float] = None # Changed from start_time
@@ -40,14 +2930,83 @@ class FishingMacro:
         self.afk_prevention_interval_max = 5 * 60 # 5 minutes
         self.next_afk_time: Optional[float] = None
         self.timer_var = tk.StringVar(value="--:-- until next move")
+        self.counters_var = tk.StringVar(value="")
+        self.ui = UiChannel() # Status from the macro thread, rendered by poll_ui()
+        self._ui_seen = 0
+        self.capture_backend = capture_backend
+        self.frames_path = frames_path # Headless: read frames from disk instead of the screen
+        self.diff_threshold = diff_threshold # Grey-level change that counts as motion (0 disables)
+        self.capture_thread: Optional[CaptureThread] = None
+        self.input_actor: Optional[InputActor] = None
+        self.stats: Optional[LatencyStats] = None
+        self.loop: Optional[EventLoop] = None # Event loop of the running macro
+        self.macro_thread: Optional[threading.Thread] = None
+        self.stats_path = stats_path # Latency report; a timestamped file under logs/ if not set
+        self.record_path = record_path # Folder to record frames and actions into, if set
+        self.match_mode = match_mode # See match_configs()
+        self.prefilter = prefilter # Colour prefilter in front of bite/bobber matching
+        self.calibration = calibration # Per-template thresholds and template subsets, if calibrated
+        self.detect_workers = detect_workers # Worker processes for template matching (0 = in-thread)
+        self.max_fps = max_fps # Capture rate cap; the PollScheduler slows down below it when it can
+        self.cpu_budget = cpu_budget # Share of one core the frame analysis may use
+        self.startup_report = startup_report # Where to write startup timings ('-' prints them), if set
+        self.ledger_path = ledger_path # SQLite session ledger every run appends to, if set
+        self.profiler = HotLoopProfiler()
+        self.profile_on_start = bool(profile) # Profile every run from its start; F8 toggles while running
+        self.profile_path = profile if isinstance(profile, str) else None # Report path; timestamped under logs/ if not set
+        self.flight_seconds = flight_seconds # Seconds of frames the flight recorder keeps (0 disables it)
+        self.flight: Optional[FlightRecorder] = None # Ring of the current or last run, kept for F7
+        self.auto_locate = auto_locate # Find the spot on screen at startup and after a lost position
+        self.bite_trigger = bite_trigger # See BITE_TRIGGERS
+        self.confirmations = confirmations # Confirming frames before a bite fires; the trigger's default if None
+        self.display_scale = round(self.root.winfo_fpixels('1i') / 96.0 * 4) / 4 # Picks the locator's pyramid
+        self.locator: Optional[SpotLocator] = None # Built on first use, see spot_locator()
+        self._locator_lock = threading.Lock()
+        self.relocated_spots: Optional[List[Spot]] = None # Spots to restart with after a relocation
+        self.recovery_pauses: Optional[List[int]] = None # Each spot's pause back-off, carried over that restart
+
+        # Heavy imports, templates and the input backend are prepared in the background (see prepare())
+        self.input_backend_name = input_backend
+        self.input_backend: Optional[InputBackend] = None # Resolved once, not per keystroke
+        self.templates: Optional[TemplateBank] = None
+        self.ready = threading.Event()
+        self.root.after_idle(self.start_prepare)
         
         # Create minimal UI
         self.create_ui()
+        self.root.bind('<F5>', self.reload_templates)
+        self.root.bind('<F9>', self.export_stats)
+        self.root.bind('<F8>', self.toggle_profile)
+        self.root.bind('<F7>', self.dump_flight)
         
         # Make window stay on top and small
         self.root.attributes('-topmost', True)
         self.root.resizable(False, False)
     
+    def start_prepare(self):
+        """Once the window is up, prepare the macro on a background thread."""
+        STARTUP.mark('window shown')
+        threading.Thread(target=self.prepare, name='prepare', daemon=True).start()
+
+    def prepare(self):
+        """Import the detection and input stacks and load the templates before the first Start."""
+        try:
+            warm_up()
+            STARTUP.mark('imports done')
+            start = time.perf_counter()
+            # Decode all templates once instead of on every frame (or reuse the bundle from the last run)
+            self.templates = TemplateBank(resource_path('assets'), cache_path=TEMPLATE_BUNDLE)
+            STARTUP.add('templates from bundle' if self.templates.from_cache else 'templates decoded',
+                        time.perf_counter() - start)
+            self.input_backend = create_input_backend(self.input_backend_name)
+            STARTUP.mark('ready')
+        except Exception as e:
+            print(f"Error preparing the macro: {e}")
+        finally:
+            self.ready.set()
+        if self.startup_report:
+            STARTUP.export(self.startup_report)
+
     def create_ui(self):
         """Create the main UI components."""
         # Main frame with minimal padding
@@ -84,6 +3043,23 @@ class FishingMacro:
             state=tk.DISABLED # Initially disabled
         )
         self.reset_btn.pack(side=tk.LEFT, padx=2)
+
+        self.add_btn = ttk.Button(
+            btn_frame,
+            text="Add Spot",
+            command=self.add_spot,
+            width=9,
+            state=tk.DISABLED # Enabled once a first spot is confirmed
+        )
+        self.add_btn.pack(side=tk.LEFT, padx=2)
+
+        self.locate_btn = ttk.Button(
+            btn_frame,
+            text="Locate",
+            command=self.locate_spot,
+            width=8
+        )
+        self.locate_btn.pack(side=tk.LEFT, padx=2)
         
         # Status label (minimal)
         self.status_var = tk.StringVar(value="Ready")
@@ -103,16 +3079,29 @@ class FishingMacro:
             foreground='green'
         )
         timer_label.pack(pady=(5, 0))
+
+        # Live counters
+        counters_label = ttk.Label(self.frame, textvariable=self.counters_var)
+        counters_label.pack(pady=(2, 0))
         
-        # Start with region selection
-        self.setup_region()
+        self.poll_ui()
+
+        # Start by looking for the spot on screen; the selection overlay is the fallback
+        if self.auto_locate:
+            self.locate_spot(fallback=True)
+        else:
+            self.setup_region()
         self.start_btn.config(state=tk.DISABLED)
         self.stop_btn.config(state=tk.DISABLED)
         self.reset_btn.config(state=tk.DISABLED)
         
-    def setup_region(self):
-        """Open a transparent overlay to select the screen region."""
-        self.reset_selection() # Ensure a clean slate for new selection
+    def setup_region(self, add=False):
+        """Open a transparent overlay to select the screen region.
+
+        With add=True the new selection is added as another spot instead of
+        replacing the existing ones.
+        """
+        self.reset_selection(keep_spots=add) # Ensure a clean slate for new selection
 
         # Create overlay window
         self.overlay = tk.Toplevel(self.root)
@@ -183,6 +3172,10 @@ class FishingMacro:
         y1, y2 = min(y1, y2), max(y1, y2)
         
         # Update or create selection rectangle
+        self.draw_selection(x1, y1, x2, y2)
+
+    def draw_selection(self, x1, y1, x2, y2):
+        """Draw the selection rectangle, or move it if it exists."""
         if self.selection_rect_id:
             self.canvas.coords(self.selection_rect_id, x1, y1, x2, y2)
         else:
@@ -289,10 +3282,86 @@ class FishingMacro:
         # Clean up overlay window
         self.cleanup_overlay()
         
+        self.spots.append(Spot(self.region, self.click_point, self.character_point))
+
         # Update status
-        self.status_var.set("Ready to start")
+        self.show_spots_ready()
+
+    def show_spots_ready(self):
+        """Enable the controls once at least one spot is set."""
+        if not self.spots:
+            return
+        if len(self.spots) == 1:
+            self.status_var.set("Ready to start")
+        else:
+            self.status_var.set(f"{len(self.spots)} spots ready to start")
         self.start_btn.config(state=tk.NORMAL)
         self.reset_btn.config(state=tk.NORMAL)
+        self.add_btn.config(state=tk.NORMAL)
+
+    def spot_locator(self) -> SpotLocator:
+        """The spot locator for the current templates and display scale (built on first use)."""
+        with self._locator_lock:
+            if self.locator is None or self.locator.version != self.templates.version:
+                self.locator = SpotLocator(self.templates, self.display_scale,
+                                           SPOT_PYRAMID.format(scale=self.display_scale))
+            return self.locator
+
+    def find_spot(self, layout=None) -> Optional[Spot]:
+        """Grab the screen and look for a fishing spot on it; layout is the spot to find again, if any."""
+        try:
+            screen, origin = grab_screen(self.capture_backend, self.frames_path)
+            return self.spot_locator().locate(screen, origin, layout)
+        except Exception as e:
+            print(f"Error locating the fishing spot: {e}")
+            return None
+
+    def locate_spot(self, fallback=False):
+        """Find the fishing spot on screen in the background and open the overlay with it to confirm.
+
+        With fallback, the overlay also opens, empty, if there is no spot.
+        """
+        if self.running:
+            return
+        if not self.ready.is_set():
+            self.status_var.set("Loading templates...")
+            self.root.after(200, self.locate_spot, fallback)
+            return
+        if self.templates is None:
+            if fallback:
+                self.setup_region()
+            return
+        self.status_var.set("Looking for water...")
+        found = []
+        thread = threading.Thread(target=lambda: found.append(self.find_spot()), name='locate', daemon=True)
+        thread.start()
+        self.root.after(50, self._locate_done, thread, found, fallback)
+
+    def _locate_done(self, thread, found, fallback):
+        if thread.is_alive():
+            self.root.after(50, self._locate_done, thread, found, fallback)
+            return
+        spot = found[0] if found else None
+        if spot is None:
+            if fallback:
+                self.setup_region()
+                self.status_var.set("No water found. Select the fishing spot.")
+            else:
+                self.status_var.set("No water found. Use Reset Selection to pick the spot.")
+            return
+        # The character point is only a guess without a layout, and the AFK moves walk relative to it,
+        # so the user confirms it on the overlay, prefilled with the region and click point found
+        self.setup_region()
+        x, y, w, h = spot.region
+        self.draw_selection(x, y, x + w, y + h)
+        self.set_click_point(*spot.click_point)
+        locator = self.locator
+        self.status_var.set(f"Found {locator.last['group']} in {locator.last['seconds'] * 1000:.0f} ms. "
+                            f"Right-click your character, then press Enter.")
+
+    def add_spot(self):
+        """Select another fishing spot to run alongside the existing ones."""
+        self.setup_region(add=True)
     
     def clear_overlay_elements(self): 
         """Clear only the visual elements from the overlay."""
@@ -305,9 +3374,11 @@ class FishingMacro:
             except (tk.TclError, AttributeError):
                 pass
 
-    def reset_selection(self): 
+    def reset_selection(self, keep_spots=False): 
         """Reset the current selection and its state variables."""
         self.clear_overlay_elements()
+        if not keep_spots:
+            self.spots = []
         self.selection_start = None
         self.selection_rect_id = None
         self.click_point = None
@@ -319,15 +3390,17 @@ class FishingMacro:
         self.start_btn.config(state=tk.DISABLED)
         self.stop_btn.config(state=tk.DISABLED)
         self.reset_btn.config(state=tk.DISABLED)
+        self.add_btn.config(state=tk.DISABLED)
         # Reset timer
         self.last_afk_prevent_time = None
         self.next_afk_time = None
         self.timer_var.set("--:-- until next move")
 
     def cancel_selection(self, event=None):
-        """Cancel the selection process and reset state."""
-        self.reset_selection()
+        """Cancel the selection process and reset state, keeping spots confirmed earlier."""
+        self.reset_selection(keep_spots=True)
         self.cleanup_overlay()
+        self.show_spots_ready()
 
     def cleanup_overlay(self):
         """Clean up the overlay window without resetting selection state."""
@@ -339,292 +3412,948 @@ class FishingMacro:
                 pass
             self.overlay = None
 
-    def update_timer(self):
-        """Update the countdown display for the next AFK prevention move."""
+    def reload_templates(self, event=None):
+        """Reload the template bank from the assets folder."""
+        if self.templates is None:
+            return # Still loading
+        self.templates.reload()
+        self.status_var.set(f"Reloaded {self.templates.count()} templates")
+
+    def export_stats(self, event=None):
+        """Write the per-stage latency percentiles of the current session to disk."""
+        if self.stats is None:
+            return None
+        path = self.stats_path or os.path.join('logs', time.strftime('latency-%Y%m%d-%H%M%S.json'))
+        try:
+            self.stats.export(path)
+        except OSError as e:
+            print(f"Error writing latency stats: {e}")
+            return None
+        if event is not None:
+            self.status_var.set(f"Latency stats saved to {path}")
+        return path
+
+    def dump_flight(self, event=None):
+        """Save the flight recorder's recent frames, scores and events (F7)."""
+        if self.running and self.loop is not None:
+            self.loop.post(self._dump_flight) # The macro thread writes into the ring
+        else:
+            self._dump_flight()
+
+    def _dump_flight(self):
+        if self.flight is None:
+            self.ui.put('status', "Flight recorder is empty")
+            return None
+        try:
+            path = self.flight.dump('manual')
+        except OSError as e:
+            print(f"Error writing flight recorder: {e}")
+            return None
+        self.ui.put('status', f"Saving flight recorder to {path}" if path else "Flight recorder is empty or busy")
+        return path
+
+    def toggle_profile(self, event=None):
+        """Switch profiling of the running macro on or off (F8); when stopped, profile from the next start."""
+        if self.running and self.loop is not None:
+            self.loop.post(self._toggle_profile)
+            return
+        self.profile_on_start = not self.profile_on_start
+        self.status_var.set("Profiling from the next start" if self.profile_on_start else "Profiling off")
+
+    def _toggle_profile(self):
+        # On the macro thread, which is the one cProfile has to watch
+        if self.profiler.active:
+            self.finish_profile()
+        else:
+            self.profiler.start()
+            self.ui.put('status', "Profiling... (F8 to stop)")
+
+    def finish_profile(self):
+        """Stop the profiler, if it runs, and write its report; returns the report path."""
+        report = self.profiler.stop()
+        if report is None:
+            return None
+        path = self.profile_path or os.path.join('logs', time.strftime('profile-%Y%m%d-%H%M%S.json'))
+        try:
+            HotLoopProfiler.export(report, path)
+        except OSError as e:
+            print(f"Error writing profile: {e}")
+            return None
+        self.ui.put('status', f"Profile saved to {path}")
+        return path
+
+    def poll_ui(self):
+        """Render the latest status, timer and counters posted by the macro thread, and notice when it ends."""
+        self._ui_seen, changes = self.ui.changes(self._ui_seen)
+        if 'status' in changes:
+            self.status_var.set(changes['status'])
+        if 'timer' in changes:
+            self.timer_var.set(changes['timer'])
+        if 'counters' in changes:
+            self.counters_var.set(changes['counters'])
+        if 'finished' in changes:
+            self.macro_finished(changes['finished'])
+        self.root.after(1000 // UI_REFRESH_HZ, self.poll_ui)
+
+    def update_timer(self, loop):
+        """Update the countdown display for the next AFK prevention move (a timer on the macro's loop)."""
+        pending = [s.next_afk_at for s in self.sessions if not s.stopped]
+        if pending:
+            self.next_afk_time = min(pending)
         if self.running and self.next_afk_time is not None:
-            remaining_seconds = int(self.next_afk_time - time.time())
+            remaining_seconds = int(self.next_afk_time - loop.clock())
             
             if remaining_seconds < 0:
                 remaining_seconds = 0
 
             hours, remainder = divmod(remaining_seconds, 3600)
             minutes, seconds = divmod(remainder, 60)
-            self.timer_var.set(f"{hours:02}:{minutes:02}:{seconds:02} until next move")
+            self.ui.put('timer', f"{hours:02}:{minutes:02}:{seconds:02} until next move")
+            totals = {}
+            for session in self.sessions:
+                for name, count in session.counters.items():
+                    totals[name] = totals.get(name, 0) + count
+            self.ui.put('counters', f"Casts {totals['casts']}  Bites {totals['bites']}  "
+                                    f"Missed {totals['bobber_missed'] + totals['bobber_lost']}")
             
             # Schedule the next update
-            self.root.after(1000, self.update_timer)
+            loop.call_later(1.0, self.update_timer, loop)
     
     def start_macro(self):
         """Start the fishing macro."""
-        if not self.region or not self.click_point or not self.character_point:
+        if not self.spots:
             self.status_var.set("Error: All points not set. Please reset and select again.")
             return
+        if self.macro_thread is not None and self.macro_thread.is_alive():
+            self.status_var.set("Still stopping, try again in a moment.")
+            return
+        if not self.ready.is_set():
+            self.status_var.set("Loading templates, starting shortly...")
+            self.root.after(200, self.start_macro)
+            return
+        if self.templates is None or self.input_backend is None:
+            self.status_var.set("Error: Templates or input could not be loaded.")
+            return
             
         self.running = True
         self.start_btn.config(state=tk.DISABLED)
         self.stop_btn.config(state=tk.NORMAL)
         self.reset_btn.config(state=tk.DISABLED)
+        self.add_btn.config(state=tk.DISABLED)
+        self.locate_btn.config(state=tk.DISABLED)
         self.status_var.set("Running...")
         
         # Start timer
         self.last_afk_prevent_time = time.time()
         
-        # Start the macro in a separate thread
-        self.macro_thread = threading.Thread(target=self.run_macro, daemon=True)
+        # Start the macro in a separate thread, driven by its own event loop
+        self.loop = EventLoop()
+        self.macro_thread = threading.Thread(target=self.run_macro, args=(self.loop,), daemon=True)
         self.macro_thread.start()
     
     def stop_macro(self):
         """Stop the fishing macro."""
         self.running = False
+        self.ui.put('status', "Stopped") # After anything the macro thread posted
+        # Wake the event loop and stop grabbing right away; run_macro joins both threads on its way out
+        if self.loop is not None:
+            self.loop.stop()
+        if self.capture_thread is not None:
+            self.capture_thread.stop()
         self.start_btn.config(state=tk.NORMAL)
         self.stop_btn.config(state=tk.DISABLED)
         self.reset_btn.config(state=tk.NORMAL)
+        self.add_btn.config(state=tk.NORMAL)
+        self.locate_btn.config(state=tk.NORMAL)
         self.status_var.set("Stopped")
         self.last_afk_prevent_time = None
 
-    def prevent_afk(self):
-        """Simulate intelligent, randomized movement to prevent being flagged as AFK."""
-        if not self.character_point or not self.click_point:
+    def run_macro(self, loop):
+        """Main macro loop: one capture of all spots feeds every spot's FishingSession in turn.
+
+        Everything runs on loop: each new frame is posted to it, the sessions'
+        waits are timers on it, and stop_macro() stops it within one frame.
+        """
+        stats = self.stats = LatencyStats()
+        detector = create_detector(self.templates, match_configs(self.match_mode, self.prefilter, self.calibration),
+                                   self.detect_workers, stats)
+        recorder = FrameRecorder(self.record_path) if self.record_path else None
+        ledger = None
+        if self.ledger_path:
+            ledger = SessionLedger(self.ledger_path, {
+                'spots': len(self.spots), 'capture': self.capture_backend, 'input': self.input_backend_name,
+                'match_mode': self.match_mode, 'prefilter': self.prefilter, 'calibrated': bool(self.calibration),
+                'detect_workers': self.detect_workers, 'diff_threshold': self.diff_threshold,
+                'max_fps': self.max_fps, 'cpu_budget': self.cpu_budget,
+                'bite_trigger': self.bite_trigger, 'confirmations': self.confirmations,
+            }, clock=loop.clock)
+            ledger.start()
+
+        # One grab covers every spot; each session gets a zero-copy slice of it
+        spots = list(self.spots)
+        left, top, width, height = bounding_region([spot.region for spot in spots])
+        if self.flight is not None:
+            self.flight.close() # Replaced by this run's ring
+        flight = self.flight = None
+        if self.flight_seconds > 0:
+            flight = self.flight = FlightRecorder(self.flight_seconds, self.max_fps, spots=len(spots),
+                                                  regions=[[x - left, y - top, w, h] for x, y, w, h in
+                                                           (spot.region for spot in spots)])
+        try:
+            source = create_frame_source((left, top, width, height), self.capture_backend, self.frames_path)
+        except Exception as e:
+            print(f"Error opening frame source: {e}")
+            detector.close()
+            if ledger is not None:
+                ledger.close()
+            self.ui.put('finished', loop)
             return
 
-        self.root.after(0, lambda: self.status_var.set("Moving to prevent AFK..."))
+        frames = LatestFrameBuffer()
+        scheduler = PollScheduler(max_fps=self.max_fps, cpu_budget=self.cpu_budget)
+        capture = CaptureThread(source, frames, max_fps=self.max_fps, stats=stats, recorder=recorder)
+        actor = InputActor(self.input_backend, stats=stats)
+        self.capture_thread, self.input_actor = capture, actor
 
-        # Determine primary direction and its opposite
-        char_x, char_y = self.character_point
-        click_x, click_y = self.click_point
-        delta_x = click_x - char_x
-        delta_y = click_y - char_y
+        def relocate(session):
+            # Search the whole screen off the macro thread; the answer comes back through the loop
+            def search():
+                start = time.perf_counter()
+                spot = self.find_spot(layout=session.spot)
+                loop.post(relocated, session, spot, time.perf_counter() - start)
+            threading.Thread(target=search, name='relocate', daemon=True).start()
 
-        if abs(delta_x) > abs(delta_y):  # Horizontal
-            if delta_x > 0:
-                facing_direction = 'right'
-                opposite_direction = 'left'
-            else:
-                facing_direction = 'left'
-                opposite_direction = 'right'
-        else:  # Vertical
-            if delta_y > 0:
-                facing_direction = 'down'
-                opposite_direction = 'up'
-            else:
-                facing_direction = 'up'
-                opposite_direction = 'down'
-        
-        # Randomly choose a movement pattern
-        move_patterns = [self._move_opposite, self._move_sideways]
-        chosen_move = random.choice(move_patterns)
+        def relocated(session, spot, seconds):
+            session.relocated(spot is not None, seconds)
+            if spot is None:
+                if all(s.stopped for s in sessions):
+                    loop.stop()
+                return
+            # Restart with the spot where it was found; macro_finished() starts the next run
+            spots[sessions.index(session)] = spot
+            self.relocated_spots = list(spots)
+            self.recovery_pauses = [s._pauses for s in sessions] # So a flapping spot keeps backing off
+            loop.stop()
 
-        if chosen_move == self._move_sideways:
-            chosen_move(facing_direction)
+        sessions = []
+        slices = []
+        pauses, self.recovery_pauses = self.recovery_pauses or [0] * len(spots), None
+        for index, spot in enumerate(spots):
+            name = f"Spot {index + 1}: " if len(spots) > 1 else ''
+            sessions.append(FishingSession(spot, detector, actor, name=name, diff_threshold=self.diff_threshold,
+                                           stats=stats, recorder=recorder,
+                                           on_status=lambda text: self.ui.put('status', text),
+                                           afk_interval=(self.afk_prevention_interval_min, self.afk_prevention_interval_max),
+                                           scheduler=scheduler, loop=loop, ledger=ledger,
+                                           flight=flight, spot_index=index,
+                                           relocate=relocate if self.auto_locate else None,
+                                           bite_trigger=self.bite_trigger, confirmations=self.confirmations,
+                                           focus=len(spots) > 1, pauses=pauses[index]))
+            x, y, w, h = spot.region
+            slices.append((slice(y - top, y - top + h), slice(x - left, x - left + w)))
+        self.sessions = sessions
+        self.update_timer(loop) # Start the UI timer
+        profiler = self.profiler
+        if self.profile_on_start:
+            profiler.start()
+
+        last_seq = 0
+
+        def on_frame():
+            nonlocal last_seq
+            item = frames.get(last_seq, 0)
+            if item is None:
+                if frames.closed:
+                    loop.stop() # Capture stopped or the frame source ran out
+                return
+            last_seq, frame_stamp, frame = item
+            started = time.perf_counter()
+            stats.add('frame_age', started - frame_stamp)
+            if flight is not None:
+                flight.write(frame, frame_stamp)
+            profiling = profiler.active
+            if profiling:
+                profiler.begin_frame()
+            for session, (rows, cols) in zip(sessions, slices):
+                session.step(frame[rows, cols], frame_stamp)
+                if loop.stopped:
+                    break
+            if profiling:
+                profiler.end_frame()
+            if loop.stopped:
+                return # Stop pressed mid-frame
+            if all(session.stopped for session in sessions):
+                loop.stop() # Every spot lost its position
+                return
+            # The scheduler decides how soon the next frame is grabbed
+            now = time.perf_counter()
+            scheduler.add_busy(now - started)
+            interval = scheduler.interval(min(session.poll_interval(now) for session in sessions))
+            capture.set_interval(interval)
+            stats.add('poll_interval', interval)
+
+        frames.on_change = lambda: loop.post(on_frame)
+        capture.start()
+        actor.start()
+        if self.running:
+            loop.run()
+
+        # Clean up when stopped: the capture thread closes the source itself
+        capture.stop()
+        actor.stop()
+        capture.join(timeout=2)
+        actor.join(timeout=2)
+        if recorder is not None:
+            recorder.close()
+        for session in sessions:
+            session.close()
+        detector.close()
+        if ledger is not None:
+            ledger.close()
+        self.finish_profile()
+        self.export_stats()
+        self.ui.put('finished', loop) # poll_ui() calls macro_finished() on the Tk thread
+
+    def macro_finished(self, loop):
+        """Reset the UI once the macro thread running loop has exited, unless a newer run started.
+
+        A run that ended because a lost spot was found again is restarted
+        with the spot's new position, unless Stop was pressed meanwhile.
+        """
+        if self.loop is not loop:
+            return
+        spots, self.relocated_spots = self.relocated_spots, None
+        restart = self.running and spots is not None
+        if not restart:
+            self.recovery_pauses = None # A fresh start begins with the shortest hold
+        self.stop_macro()
+        if restart:
+            self.spots = spots
+            self.macro_thread.join(timeout=2) # Past its last line already
+            self.start_macro()
+            self.status_var.set("Found the water again. Fishing resumed.")
+
+class ReplayInput:
+    """Fake input sink for replays: records actions instead of sending them.
+
+    Implements InputActor.submit(). Actions never run and count as issued at
+    the current replay time, so click latency is not measured on replay.
+    """
+    def __init__(self):
+        self.actions: List[dict] = []
+        self.frame_index = 0
+        self.now = 0.0
+
+    def submit(self, steps, settle=0.0, on_issued=None, label=None, at=None, urgent=False) -> ActionTicket:
+        ticket = ActionTicket()
+        ticket.issued_at = self.now
+        ticket._done.set()
+        self.actions.append({'event': label, 'frame': self.frame_index, 't': self.now})
+        return ticket
+
+    def click(self, point, **kwargs) -> ActionTicket:
+        return self.submit(click_steps(point), **kwargs)
+
+def replay_frames(frames, bank, timestamps=None, stats=None, diff_threshold=12, fps=30.0, configs=None,
+                  detect_workers=0, scheduler=None, ledger_path=None, settings=None, profiler=None,
+                  bite_trigger='temporal', confirmations=None):
+    """Run recorded frames through a FishingSession as fast as possible.
+
+    The session is the same state machine the live macro runs, driven by the
+    recorded timestamps instead of the clock and wired to a ReplayInput.
+    With a PollScheduler, frames recorded before the next poll is due are
+    skipped, as the capture thread would not have grabbed them.
+    With ledger_path, the session's transitions go to that SessionLedger as
+    one run, on recorded time. A started HotLoopProfiler counts every
+    stepped frame.
+    Returns the session; its actor holds every action taken.
+    """
+    detector = create_detector(bank, configs, detect_workers, stats)
+    sink = ReplayInput()
+    sink.now = float(timestamps[0]) if timestamps is not None and len(timestamps) else 0.0
+    loop = EventLoop(clock=lambda: sink.now) # Session timers fire on replay time
+    ledger = None
+    if ledger_path:
+        ledger = SessionLedger(ledger_path, settings, clock=loop.clock)
+        ledger.start()
+    height, width = frames[0].shape[:2]
+    session = FishingSession(Spot((0, 0, width, height), (0, 0), (0, 0)), detector, sink,
+                             diff_threshold=diff_threshold, stats=stats, scheduler=scheduler, loop=loop,
+                             ledger=ledger, bite_trigger=bite_trigger, confirmations=confirmations)
+    session.analysed = 0 # Frames actually stepped
+    next_due = float('-inf')
+    try:
+        for index in range(len(frames)):
+            now = float(timestamps[index]) if timestamps is not None else index / fps
+            if now < next_due:
+                continue
+            start = time.perf_counter()
+            frame = np.ascontiguousarray(frames[index])
+            if stats is not None:
+                stats.add('load', time.perf_counter() - start)
+            sink.frame_index, sink.now = index, now
+            loop.run_due(now)
+            stepped = time.perf_counter()
+            if profiler is not None:
+                profiler.begin_frame()
+            session.step(frame, now, now=now)
+            if profiler is not None:
+                profiler.end_frame()
+            session.analysed += 1
+            if stats is not None:
+                stats.add('frame', time.perf_counter() - start)
+            if scheduler is not None:
+                scheduler.add_busy(time.perf_counter() - stepped)
+                next_due = now + scheduler.interval(session.poll_interval(now))
+            if session.stopped:
+                break
+    finally:
+        session.close()
+        detector.close()
+        if ledger is not None:
+            ledger.close()
+    return session
+
+def match_events(predicted, expected, tolerance):
+    """Pair predicted and expected frame indices within tolerance frames.
+
+    Returns (true positives, false positives, false negatives, per-match offsets).
+    """
+    unmatched = sorted(expected)
+    offsets = []
+    false_positives = 0
+    for frame in sorted(predicted):
+        best = None
+        for candidate in unmatched:
+            if abs(candidate - frame) <= tolerance and (best is None or abs(candidate - frame) < abs(best - frame)):
+                best = candidate
+        if best is None:
+            false_positives += 1
         else:
-            chosen_move(facing_direction, opposite_direction)
+            unmatched.remove(best)
+            offsets.append(frame - best)
+    return len(offsets), false_positives, len(unmatched), offsets
 
-    def _move_opposite(self, facing_direction, opposite_direction):
-        """Move one step opposite and immediately return, repeating 1-3 times."""
-        repeat_times = random.randint(1, 3)
-        for _ in range(repeat_times):
-            if platform.system() == "Windows":
-                pydirectinput.keyDown(opposite_direction)
-                time.sleep(0.02)
-                pydirectinput.keyUp(opposite_direction)
-                
-                pydirectinput.keyDown(facing_direction)
-                time.sleep(0.02)
-                pydirectinput.keyUp(facing_direction)
+def load_labels(path, recording=None):
+    """Bite frame indices from a labels file, or the reels logged in a recording.
+
+    A labels file is JSON of the form {"bites": [frame_index, ...]}.
+    Returns None when there is nothing to compare against, including a
+    recording that logged no reels.
+    """
+    if path:
+        with open(path) as f:
+            return [int(i) for i in json.load(f)['bites']]
+    if recording is not None:
+        return [recording.frame_index(e['t']) for e in recording.events if e['event'] == 'reel'] or None
+    return None
+
+def run_benchmark(args):
+    """Replay a recording and report throughput, stage latency and label agreement."""
+    source = FileFrameSource(args.recording, loop=False)
+    frames = source.frames
+    recording = frames if isinstance(frames, Recording) else None
+    timestamps = recording.timestamps if recording is not None else None
+    bank = TemplateBank(resource_path('assets'))
+    stats = LatencyStats(window=1000000)
+
+    configs = match_configs(args.match_mode, args.prefilter, load_calibration(args.calibration))
+
+    profiler = None
+    if args.profile:
+        profiler = HotLoopProfiler()
+        profiler.start()
+    start = time.perf_counter()
+    session = replay_frames(frames, bank, timestamps=timestamps, stats=stats,
+                            diff_threshold=args.diff_threshold, fps=args.fps,
+                            configs=configs, detect_workers=args.detect_workers,
+                            scheduler=PollScheduler(args.max_fps, cpu_budget=args.cpu_budget) if args.adaptive else None,
+                            ledger_path=args.ledger,
+                            settings={'replay': args.recording, 'match_mode': args.match_mode, 'prefilter': args.prefilter,
+                                      'adaptive': args.adaptive, 'diff_threshold': args.diff_threshold,
+                                      'bite_trigger': args.bite_trigger, 'confirmations': args.confirmations},
+                            profiler=profiler, bite_trigger=args.bite_trigger, confirmations=args.confirmations)
+    elapsed = time.perf_counter() - start
+    if profiler is not None:
+        HotLoopProfiler.export(profiler.stop(), args.profile)
+    sink = session.actor
+
+    report = {
+        'frames': len(frames),
+        'seconds': elapsed,
+        'fps': len(frames) / elapsed if elapsed > 0 else 0.0,
+        'actions': sink.actions,
+        'counters': session.counters,
+        'analysed': session.analysed,
+        'stages': stats.summary(),
+        'detect_workers': args.detect_workers,
+    }
+    if args.detect_workers > 0:
+        # Same replay on the in-thread detector for comparison
+        baseline = LatencyStats(window=1000000)
+        start = time.perf_counter()
+        replay_frames(frames, bank, timestamps=timestamps, stats=baseline, diff_threshold=args.diff_threshold,
+                      fps=args.fps, configs=configs, bite_trigger=args.bite_trigger, confirmations=args.confirmations)
+        baseline_elapsed = time.perf_counter() - start
+        report['in_thread'] = {
+            'seconds': baseline_elapsed,
+            'fps': len(frames) / baseline_elapsed if baseline_elapsed > 0 else 0.0,
+            'detect': baseline.summary().get('detect'),
+        }
+    if args.compare_trigger:
+        # Same replay with the other bite rule; matched reels give the lead time
+        other = 'frame' if args.bite_trigger == 'temporal' else 'temporal'
+        baseline = replay_frames(frames, bank, timestamps=timestamps, diff_threshold=args.diff_threshold,
+                                 fps=args.fps, configs=configs, bite_trigger=other).actor
+        interval = float(np.median(np.diff(timestamps))) if timestamps is not None and len(timestamps) > 1 \
+            else 1.0 / args.fps
+        reels = [a['t'] for a in sink.actions if a['event'] == 'reel']
+        baseline_reels = [a['t'] for a in baseline.actions if a['event'] == 'reel']
+        matched, only_new, only_baseline, offsets = match_events(reels, baseline_reels, args.tolerance * interval)
+        leads = [-offset for offset in offsets] # Positive: this rule reeled first
+        report['trigger_lead'] = {
+            'rule': args.bite_trigger, 'against': other, 'reels': len(reels), 'baseline_reels': len(baseline_reels),
+            'matched': matched, 'only_this_rule': only_new, 'only_baseline': only_baseline,
+            'mean_lead_ms': float(np.mean(leads)) * 1000 if leads else 0.0,
+            'median_lead_ms': float(np.median(leads)) * 1000 if leads else 0.0,
+            'mean_lead_frames': float(np.mean(leads)) / interval if leads else 0.0,
+        }
+    labels = load_labels(args.labels, recording)
+    if labels is not None:
+        reels = [a['frame'] for a in sink.actions if a['event'] == 'reel']
+        tp, fp, fn, offsets = match_events(reels, labels, args.tolerance)
+        report['agreement'] = {
+            'labelled': len(labels), 'true_positives': tp, 'false_positives': fp, 'false_negatives': fn,
+            'precision': tp / (tp + fp) if tp + fp else 1.0,
+            'recall': tp / (tp + fn) if tp + fn else 1.0,
+            'mean_offset_frames': float(np.mean(offsets)) if offsets else 0.0,
+        }
+
+    print(f"{report['frames']} frames in {elapsed:.2f}s ({report['fps']:.1f} fps)")
+    for stage, row in report['stages'].items():
+        print(f"  {stage:24s} n={row['count']:<6d} p50={row['p50_ms']:7.2f}ms "
+              f"p95={row['p95_ms']:7.2f}ms p99={row['p99_ms']:7.2f}ms")
+    events = {}
+    for action in sink.actions:
+        events[action['event']] = events.get(action['event'], 0) + 1
+    print(f"Actions: {events or 'none'}")
+    print(f"Session: {session.counters}")
+    if args.adaptive:
+        print(f"Adaptive polling analysed {session.analysed} of {report['frames']} frames")
+    if 'in_thread' in report:
+        base = report['in_thread']
+        detect, base_detect = report['stages'].get('detect'), base['detect']
+        print(f"{args.detect_workers} worker processes: {report['fps']:.1f} fps vs {base['fps']:.1f} fps in-thread"
+              + (f", detect p50 {detect['p50_ms']:.2f}ms vs {base_detect['p50_ms']:.2f}ms"
+                 if detect and base_detect else ''))
+    if 'trigger_lead' in report:
+        lead = report['trigger_lead']
+        print(f"Bite trigger '{lead['rule']}' vs '{lead['against']}': {lead['matched']} of {lead['reels']} reels matched, "
+              f"{lead['mean_lead_ms']:+.1f} ms ({lead['mean_lead_frames']:+.2f} frames) lead on average; "
+              f"{lead['only_baseline']} reels only with '{lead['against']}', {lead['only_this_rule']} only with '{lead['rule']}'")
+    if 'agreement' in report:
+        a = report['agreement']
+        print(f"Agreement with {a['labelled']} labelled bites (+/-{args.tolerance} frames): "
+              f"precision {a['precision']:.2f}, recall {a['recall']:.2f}, "
+              f"{a['false_positives']} false / {a['false_negatives']} missed")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    return report
+
+def load_frame_labels(path) -> Dict[str, set]:
+    """Read {"group": [frame, [first, last], ...]} into a set of frame indices per group."""
+    with open(path) as f:
+        data = json.load(f)
+    labels = {}
+    for group, entries in data.items():
+        frames = set()
+        for entry in entries:
+            if isinstance(entry, list):
+                frames.update(range(int(entry[0]), int(entry[1]) + 1))
             else:
-                pyautogui.keyDown(opposite_direction)
-                time.sleep(0.02)
-                pyautogui.keyUp(opposite_direction)
+                frames.add(int(entry))
+        labels[group] = frames
+    return labels
 
-                pyautogui.keyDown(facing_direction)
-                time.sleep(0.02)
-                pyautogui.keyUp(facing_direction)
+def best_threshold(positives, negatives):
+    """Threshold that best separates positive from negative scores.
 
-    def _move_sideways(self, facing_direction):
-        """Move one step sideways and immediately return, with randomization."""
-        if facing_direction in ['up', 'down']:
-            side_keys = ['left', 'right']
+    Maximises true positive rate minus false positive rate; among equal
+    choices the widest gap wins, and the threshold sits in its middle.
+    Returns (threshold, true positive rate, false positive rate).
+    """
+    pos, neg = np.asarray(positives, dtype=np.float64), np.asarray(negatives, dtype=np.float64)
+    scores = np.unique(np.concatenate([pos, neg]))
+    best = None
+    for low, high in zip(scores[:-1], scores[1:]):
+        threshold = (low + high) / 2
+        tpr = float((pos > threshold).mean()) if len(pos) else 0.0
+        fpr = float((neg > threshold).mean()) if len(neg) else 0.0
+        key = (tpr - fpr, high - low)
+        if best is None or key > best[0]:
+            best = (key, float(threshold), tpr, fpr)
+    if best is None:
+        return float(scores[0]) - 1e-3, 1.0, 1.0 # Only one distinct score
+    return best[1], best[2], best[3]
+
+CALIBRATION_MIN_SIZE = 24 # Templates with a shorter side (px) than this are too small to calibrate reliably
+CALIBRATION_MIN_THRESHOLD = 0.3 # A template needing a lower threshold than this matches noise, not the sprite
+
+def run_calibration(args):
+    """Score every template on labelled frames, then pick thresholds and the smallest template set.
+
+    Only the 'found' threshold of each template and the group's 'present'
+    threshold are calibrated; the water thresholds are not, as nothing
+    labels the frames where recovery should end.
+    """
+    frames = FileFrameSource(args.recording, loop=False).frames
+    labels = load_frame_labels(args.labels)
+    bank = TemplateBank(resource_path('assets'))
+    configs = match_configs(args.match_mode)
+    groups = [g for g in labels if g in configs and 'found' in configs[g].thresholds and bank.get(g)]
+    for group in labels:
+        if group not in groups:
+            print(f"{group}: cannot be calibrated (only groups with a 'found' threshold and templates); labels ignored")
+    if not groups:
+        print("No labelled group to calibrate (expected bite and/or bobber)")
+        return None
+    detector = TemplateDetector(bank, configs)
+
+    # Best score of every template on every sampled frame
+    indices = list(range(0, len(frames), args.step))
+    scores = {g: {t.name: [] for t in bank.get(g)} for g in groups}
+    try:
+        for index in indices:
+            results = detector.detect(np.ascontiguousarray(frames[index]), groups)
+            for group in groups:
+                for template in bank.get(group):
+                    scores[group][template.name].append(results[group].scores.get(template.name, -1.0))
+    finally:
+        detector.close()
+
+    calibration = {'match_mode': args.match_mode, 'frames': len(indices), 'groups': {}}
+    for group in groups:
+        positive = np.array([index in labels[group] for index in indices])
+        if positive.all() or not positive.any():
+            print(f"{group}: needs both labelled and unlabelled frames; skipped")
+            continue
+        report = {}
+        hits, false_hits, rejected = {}, {}, {}
+        sizes = {t.name: min(t.width, t.height) for t in bank.get(group)}
+        for name, values in scores[group].items():
+            values = np.asarray(values)
+            threshold, tpr, fpr = best_threshold(values[positive], values[~positive])
+            if sizes[name] < CALIBRATION_MIN_SIZE:
+                rejected[name] = 'too small'
+            elif threshold < CALIBRATION_MIN_THRESHOLD:
+                rejected[name] = 'below floor'
+            hits[name] = set(np.flatnonzero(positive & (values > threshold)))
+            false_hits[name] = set(np.flatnonzero(~positive & (values > threshold)))
+            report[name] = {'threshold': round(threshold, 4), 'recall': tpr, 'false_positive_rate': fpr,
+                            'positive_min': float(values[positive].min()),
+                            'positive_mean': float(values[positive].mean()),
+                            'negative_max': float(values[~positive].max())}
+
+        # Greedy cover: add the template with the most newly caught frames net of its new false hits, while
+        # that stays positive; ties go to the fewest new false hits, then the widest gap between labelled and other scores
+        eligible = [n for n in hits if n not in rejected]
+        target = set().union(*(hits[n] for n in eligible))
+        chosen, covered, false_covered = [], set(), set()
+        while covered != target:
+            def gain(n):
+                return len(hits[n] - covered) - len(false_hits[n] - false_covered)
+            name = max((n for n in eligible if n not in chosen),
+                       key=lambda n: (gain(n), -len(false_hits[n] - false_covered),
+                                      report[n]['positive_min'] - report[n]['negative_max']))
+            if not hits[name] - covered or gain(name) <= 0:
+                break
+            chosen.append(name)
+            covered |= hits[name]
+            false_covered |= false_hits[name]
+        recall = len(covered) / int(positive.sum())
+        precision = len(covered) / (len(covered) + len(false_covered)) if covered else 0.0
+        calibration['groups'][group] = {
+            'thresholds': {name: report[name]['threshold'] for name in chosen},
+            'recall': recall, 'precision': precision,
+            'dropped': sorted(n for n in report if n not in chosen),
+            'rejected': rejected,
+            'templates': report,
+        }
+
+        # 'present' judges the group's best offset score (as apply_calibration computes it) and should be lenient:
+        # halfway between the highest score on unlabelled frames and 'found', and never above 'found'
+        present = None
+        if chosen and 'present' in configs[group].thresholds:
+            found = configs[group].threshold('found')
+            group_scores = np.max([np.asarray(scores[group][n]) - report[n]['threshold'] + found for n in chosen], axis=0)
+            present = min((float(group_scores[~positive].max()) + found) / 2, found)
+            calibration['groups'][group]['present'] = round(present, 4)
+
+        print(f"{group}: {int(positive.sum())} labelled of {len(indices)} frames")
+        for name, row in report.items():
+            print(f"  {name:16s} threshold {row['threshold']:.3f}  recall {row['recall']:.2f}  "
+                  f"false {row['false_positive_rate']:.2f}  labelled min {row['positive_min']:.3f}  "
+                  f"other max {row['negative_max']:.3f}  "
+                  f"{'kept' if name in chosen else rejected.get(name, 'dropped')}")
+        print(f"  {len(chosen)} of {len(report)} templates kept: recall {recall:.2f}, precision {precision:.2f}"
+              + (f", present {present:.3f}" if present is not None else ''))
+
+    with open(args.output, 'w') as f:
+        json.dump(calibration, f, indent=2)
+    print(f"Calibration written to {args.output}")
+    return calibration
+
+def run_engine_benchmark(args):
+    """Time one matchTemplate per template against FFTCorrelator as the template count grows."""
+    bank = TemplateBank(resource_path('assets'))
+    templates = [t for group in ('bobber', 'bite', 'water') for t in bank.get(group)]
+    if not templates:
+        print("No templates found in assets/")
+        return None
+    source = None
+    if args.frames:
+        frames = FileFrameSource(args.frames, loop=False).frames
+        source = np.ascontiguousarray(frames[len(frames) // 2])
+    counts = []
+    count = 1
+    while count < args.max_templates:
+        counts.append(count)
+        count *= 2
+    counts.append(args.max_templates)
+
+    report = {'sizes': []}
+    rng = np.random.default_rng(0)
+    for size in args.sizes:
+        width, height = (int(v) for v in size.lower().split('x'))
+        if source is not None:
+            frame = cv2.resize(source, (width, height), interpolation=cv2.INTER_AREA)
         else:
-            side_keys = ['up', 'down']
-        
-        random.shuffle(side_keys) # Randomize the order of movement
-        side1, side2 = side_keys
+            frame = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+        usable = [t for t in templates if t.height <= height and t.width <= width]
+        if not usable:
+            continue
+        chosen = [usable[i % len(usable)] for i in range(args.max_templates)]
+        FFTCorrelator(frame).match(chosen[0]) # Warm the spectrum caches
 
-        if platform.system() == "Windows":
-            pydirectinput.keyDown(side1)
-            time.sleep(0.02)
-            pydirectinput.keyUp(side1)
-            
-            pydirectinput.keyDown(side2)
-            time.sleep(0.02)
-            pydirectinput.keyUp(side2)
+        def loop(n):
+            for template in chosen[:n]:
+                cv2.minMaxLoc(cv2.matchTemplate(frame, template.image, cv2.TM_CCOEFF_NORMED))
+
+        def fft(n):
+            correlator = FFTCorrelator(frame)
+            for template in chosen[:n]:
+                cv2.minMaxLoc(correlator.match(template))
+
+        rows = []
+        for n in counts:
+            for template in set(chosen[:n]):
+                FFTCorrelator(frame).match(template)
+            timings = {}
+            for name, run in (('loop', loop), ('fft', fft)):
+                samples = []
+                for _ in range(args.repeat):
+                    start = time.perf_counter()
+                    run(n)
+                    samples.append(time.perf_counter() - start)
+                timings[name] = float(np.median(samples)) * 1000.0
+            rows.append({'templates': n, 'loop_ms': timings['loop'], 'fft_ms': timings['fft']})
+        crossover = next((row['templates'] for row in rows if row['fft_ms'] < row['loop_ms']), None)
+        report['sizes'].append({'size': f"{width}x{height}", 'rows': rows, 'crossover': crossover})
+
+        print(f"Region {width}x{height}:")
+        for row in rows:
+            print(f"  {row['templates']:4d} templates  loop {row['loop_ms']:8.2f}ms  fft {row['fft_ms']:8.2f}ms")
+        print(f"  FFT wins from {crossover} templates" if crossover else "  FFT never wins at this size")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    return report
+
+def run_ledger_summary(args):
+    """Print the ledger summary: one line per run, followed by its spots when there are several."""
+    if not os.path.exists(args.ledger):
+        print(f"No ledger at {args.ledger}")
+        return []
+    rows = ledger_summary(args.ledger, args.run)
+    spots = {}
+    for row in rows:
+        if row['spot'] is not None:
+            spots[row['run']] = spots.get(row['run'], 0) + 1
+    for row in rows:
+        if row['spot'] is None:
+            label = f"Run {row['run']} {time.strftime('%Y-%m-%d %H:%M', time.localtime(row['started']))}"
+        elif spots[row['run']] > 1:
+            label = f"  {row['spot']}"
         else:
-            pyautogui.keyDown(side1)
-            time.sleep(0.02)
-            pyautogui.keyUp(side1)
-            
-            pyautogui.keyDown(side2)
-            time.sleep(0.02)
-            pyautogui.keyUp(side2)
+            continue # Same numbers as the run line
+        parts = [f"{row['hours'] * 60:.1f} min", f"{row['casts']} casts ({row['casts_per_hour']:.0f}/h)",
+                 f"{row['reels']} reels ({row['reels_per_hour']:.0f}/h, {row['reel_rate']:.0%} of casts)"]
+        if row['mean_time_to_bite'] is not None:
+            parts.append(f"bite {row['mean_time_to_bite']:.1f}s after the cast")
+        parts += [f"failures {row['failure_rate']:.0%} ({row['bobber_missed']} missed, {row['bobber_lost']} lost)",
+                  f"{row['bites_ignored']} early bites ignored",
+                  f"{row['recoveries']} recoveries" + (f" ({row['mean_recovery']:.1f}s each)" if row['recoveries'] else ''),
+                  f"{row['paused_seconds']:.0f}s paused",
+                  f"{row['position_lost']} position lost ({row['relocated']} found again)", f"{row['afk_moves']} AFK moves", f"{row['errors']} errors"]
+        print(f"{label}: " + ', '.join(parts))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(rows, f, indent=2)
+    return rows
 
-    
-    def run_macro(self):
-        """Main macro loop."""
-        bobber_present_templates = ['bobber.png', 'bobber2.png', 'bobber3.png', 'bobber4.png']
-        bite_templates = ['capture.PNG', 'capture2.PNG', 'capture3.PNG', 'capture4.PNG', 'capture5.PNG']
-
-        # Helper to detect any of the given templates
-        def detect_any_template(screenshot, templates, confidence=0.8):
-            for template_file in templates:
-                try:
-                    template_path = resource_path(f'assets/{template_file}')
-                    template = cv2.imread(template_path)
-                    if template is None:
-                        continue
-                        
-                    # Check if template is larger than screenshot
-                    if template.shape[0] > screenshot.shape[0] or template.shape[1] > screenshot.shape[1]:
-                        # Skip this template if it's larger than the screenshot
-                        continue
-                        
-                    result = cv2.matchTemplate(screenshot, template, cv2.TM_CCOEFF_NORMED)
-                    _, max_val, _, _ = cv2.minMaxLoc(result)
-                    if max_val > confidence:
-                        return True
-                except Exception as e:
-                    print(f"Error processing template {template_file}: {e}")
-                    continue
-            return False
+def run_locate(args):
+    """Look for a fishing spot on the screen or a screenshot and report where and how fast."""
+    bank = TemplateBank(resource_path('assets'), cache_path=TEMPLATE_BUNDLE)
+    start = time.perf_counter()
+    locator = SpotLocator(bank, args.scale, SPOT_PYRAMID.format(scale=args.scale))
+    print(f"Template pyramid for display scale {args.scale} {'loaded' if locator.from_cache else 'built'} "
+          f"in {(time.perf_counter() - start) * 1000:.0f} ms")
+    screen, origin = grab_screen(args.capture, args.image)
+    timings = []
+    for _ in range(args.repeat):
+        spot = locator.locate(screen, origin)
+        timings.append(locator.last['seconds'] * 1000)
+    print(f"Searched {screen.shape[1]}x{screen.shape[0]} in {np.median(timings):.0f} ms (median of {args.repeat})")
+    if spot is None:
+        print("No water or bobber found")
+        return None
+    print(f"Found {locator.last['group']} (score {locator.last['score']:.2f}, zoom {locator.last['zoom']}): "
+          f"region {spot.region}, click point {spot.click_point}, character {spot.character_point}")
+    return spot
 
-        last_action = time.time() # Initialize last_action
-        consecutive_bobber_failures = 0 # New counter for consecutive failures
-        
-        # Set the first random interval and next AFK time
-        afk_check_interval = random.randint(self.afk_prevention_interval_min, self.afk_prevention_interval_max)
-        self.next_afk_time = time.time() + afk_check_interval
-        self.root.after(0, self.update_timer) # Start the UI timer
+def parse_args(argv=None):
+    """Parse command line options."""
+    parser = argparse.ArgumentParser(description="Fishing Macro")
+    parser.add_argument('--capture', choices=CAPTURE_BACKENDS, default='auto',
+                        help="screen capture backend (default: mss if installed)")
+    parser.add_argument('--frames', metavar='PATH',
+                        help="read frames from a .npy stack, image or folder instead of the screen")
+    parser.add_argument('--diff-threshold', type=int, default=12, metavar='LEVEL',
+                        help="grey-level change that counts as motion while waiting for a bite (0 disables the frame gate)")
+    parser.add_argument('--stats', metavar='PATH',
+                        help="where to write per-stage latency percentiles (.json or .csv); default logs/latency-<time>.json")
+    parser.add_argument('--match-mode', choices=MATCH_MODES, default='full',
+                        help="full: colour at full resolution; pyramid: half-scale grayscale search confirmed in colour; "
+                             "gray: full-resolution grayscale; fft: like full, computed from one FFT of the frame (default: full)")
+    parser.add_argument('--prefilter', action='store_true',
+                        help="skip bite/bobber matching on frames without their sprite colours, "
+                             "and match only around the pixels that have them")
+    parser.add_argument('--startup-report', nargs='?', const='-', metavar='JSON',
+                        help="print startup timings once the macro is ready, or write them to JSON")
+    parser.add_argument('--calibration', metavar='JSON',
+                        help=f"per-template thresholds from the calibrate command (default: {CALIBRATION_FILE} if present)")
+    parser.add_argument('--ledger', default=LEDGER_FILE, metavar='DB',
+                        help=f"SQLite ledger every run's casts, bites and failures are appended to (default: {LEDGER_FILE})")
+    parser.add_argument('--no-ledger', dest='ledger', action='store_const', const=None,
+                        help="do not keep a session ledger")
+    parser.add_argument('--profile', nargs='?', const=True, metavar='JSON',
+                        help="profile the macro loop from Start to Stop (F8 toggles it while running) and write "
+                             "the report to JSON (default: logs/profile-<time>.json)")
+    parser.add_argument('--flight-seconds', type=float, default=10.0, metavar='SECONDS',
+                        help="seconds of recent frames kept in memory and saved under logs/ when a spot fails "
+                             "or on F7, up to 128 MB (default: 10; 0 disables)")
+    parser.add_argument('--no-locate', dest='auto_locate', action='store_false',
+                        help="open the selection overlay at startup instead of looking for the spot, and stop a spot "
+                             "that loses its position instead of searching the screen for it")
+    parser.add_argument('--bite-trigger', choices=tuple(BITE_TRIGGERS), default='temporal',
+                        help="temporal: confirm bites over several frames, firing early on a rising score; "
+                             "frame: any single frame above the threshold (default: temporal)")
+    parser.add_argument('--confirmations', type=int, metavar='N',
+                        help="frames in a row that must confirm a bite before reeling (default: 2 for temporal)")
+    parser.add_argument('--record', metavar='DIR',
+                        help="record every captured frame and action to DIR for offline replay")
+    parser.add_argument('--detect-workers', type=int, default=0, metavar='N',
+                        help="run template matching in N worker processes (default: 0, in the macro thread)")
+    parser.add_argument('--input', choices=INPUT_BACKENDS, default='auto',
+                        help="input backend; 'record' sends nothing and only logs actions (default: pydirectinput "
+                             "keys on Windows, pyautogui elsewhere)")
+    parser.add_argument('--max-fps', type=float, default=60, metavar='FPS',
+                        help="highest capture rate; polling slows below it while a bite is unlikely (default: 60)")
+    parser.add_argument('--cpu-budget', type=float, default=1.0, metavar='CORES',
+                        help="share of one core frame analysis may use before polling slows down (default: 1.0)")
+    commands = parser.add_subparsers(dest='command')
 
-        while self.running:
-            try:
-                # --- AFK Prevention Check ---
-                if time.time() > self.next_afk_time:
-                    self.prevent_afk()
-                    # Set the next random interval and AFK time
-                    afk_check_interval = random.randint(self.afk_prevention_interval_min, self.afk_prevention_interval_max)
-                    self.next_afk_time = time.time() + afk_check_interval
-                    # After moving, it's safer to recast
-                    self.root.after(0, lambda: self.status_var.set("AFK prevention done. Recasting..."))
-                    continue # Skip to the next loop iteration to recast
-
-                # --- Phase 1: Cast and wait for bobber to appear ---
-                self.root.after(0, lambda: self.status_var.set("Casting..."))
-                pyautogui.click(*self.click_point) # Cast
-                last_action = time.time() # Update last_action after casting
-
-                self.root.after(0, lambda: self.status_var.set("Casting... Detecting bobber."))
-                bobber_found = False
-                start_waiting_time = time.time()
-                wait_timeout = 1 # seconds to wait for bobber
-
-                while self.running and not bobber_found and (time.time() - start_waiting_time < wait_timeout):
-                    screenshot = pyautogui.screenshot(region=self.region)
-                    screenshot = cv2.cvtColor(np.array(screenshot), cv2.COLOR_RGB2BGR)
-                    if detect_any_template(screenshot, bobber_present_templates):
-                        bobber_found = True
-                        break
-                    time.sleep(0.05) # Small delay to prevent high CPU during waiting
-
-                if not bobber_found:
-                    consecutive_bobber_failures += 1
-                    self.root.after(0, lambda: self.status_var.set(f"Bobber not detected ({consecutive_bobber_failures}/3)."))
-                    if consecutive_bobber_failures >= 3:
-                        # 1. Announce pause and wait 15 seconds
-                        self.root.after(0, lambda: self.status_var.set("Bobber not found. Pausing for 15s..."))
-                        time.sleep(15)
-
-                        # 2. After delay, verify water position
-                        self.root.after(0, lambda: self.status_var.set("Verifying water position..."))
-                        screenshot = pyautogui.screenshot(region=self.region)
-                        screenshot_cv = cv2.cvtColor(np.array(screenshot), cv2.COLOR_RGB2BGR)
-                        water_templates = ['water.png', 'water2.png', 'water3.png']
-
-                        # 3. Check for water
-                        if detect_any_template(screenshot_cv, water_templates, confidence=0.2):
-                            # 4. Water is present, continue the loop
-                            self.root.after(0, lambda: self.status_var.set("Water found. Resuming fishing..."))
-                            consecutive_bobber_failures = 0 # Reset for the retry
-                            continue # Go to next loop iteration
-                        else:
-                            # 5. Water not found, this is a fatal error
-                            self.root.after(0, lambda: self.status_var.set("Position Lost! No water detected."))
-                            self.root.after(0, self.stop_macro)
-                            break # Exit the main while loop
-                    continue # Go back to the beginning of the main while loop to re-cast
-                else:
-                    consecutive_bobber_failures = 0 # Reset counter on success
-
-                self.root.after(0, lambda: self.status_var.set("Bobber present. Waiting for bite..."))
-
-                # --- Phase 2: Monitor for bite or bobber disappearance ---
-                while self.running and bobber_found: # Loop while bobber is present
-                    screenshot = pyautogui.screenshot(region=self.region)
-                    screenshot = cv2.cvtColor(np.array(screenshot), cv2.COLOR_RGB2BGR)
-
-                    # Check for bite
-                    if detect_any_template(screenshot, bite_templates):
-                        if time.time() - last_action > 1.0: # Prevent rapid clicks
-                            pyautogui.click(*self.click_point) # Reel in
-                            time.sleep(0.2) # Delay after reeling in
-                            self.root.after(0, lambda: self.status_var.set("Bite detected! Reeling in..."))
-                            bobber_found = False # Bobber is now gone, exit inner loop to re-cast
-                            break # Exit inner loop to go back to casting phase
-                    else:
-                        # If no bite, check if bobber is still present
-                        if not detect_any_template(screenshot, bobber_present_templates, confidence=0.7): # Lower confidence for presence check
-                            consecutive_bobber_failures += 1
-                            self.root.after(0, lambda: self.status_var.set(f"Bobber disappeared ({consecutive_bobber_failures}/3)."))
-                            bobber_found = False # Bobber is gone, exit inner loop to re-cast
-                            if consecutive_bobber_failures >= 3:
-                                # 1. Announce pause and wait 15 seconds
-                                self.root.after(0, lambda: self.status_var.set("Bobber disappeared. Pausing for 15s..."))
-                                time.sleep(15)
-
-                                # 2. After delay, verify water position
-                                self.root.after(0, lambda: self.status_var.set("Verifying water position..."))
-                                screenshot_after_delay = pyautogui.screenshot(region=self.region)
-                                screenshot_cv = cv2.cvtColor(np.array(screenshot_after_delay), cv2.COLOR_RGB2BGR)
-                                water_templates = ['water.png', 'water2.png', 'water3.png']
-
-                                # 3. Check for water
-                                if detect_any_template(screenshot_cv, water_templates, confidence=0.5):
-                                    # 4. Water is present, continue the loop
-                                    self.root.after(0, lambda: self.status_var.set("Water found. Resuming fishing..."))
-                                    consecutive_bobber_failures = 0 # Reset for the retry
-                                    break # Exit inner loop to go back to casting phase
-                                else:
-                                    # 5. Water not found, this is a fatal error
-                                    self.root.after(0, lambda: self.status_var.set("Position Lost! No water detected."))
-                                    self.root.after(0, self.stop_macro)
-                                    break # Exit the main while loop
-                            break # Exit inner loop to go back to casting phase
-                        else:
-                            consecutive_bobber_failures = 0 # Reset counter on success
-
-                    # No explicit sleep here to keep it fast, as requested.
-                    # The screenshot and image processing provide some natural delay.
+    bench = commands.add_parser('benchmark', help="replay a recording through the detector and report speed and accuracy")
+    bench.add_argument('recording', help="recording folder written with --record, or a .npy stack / image folder")
+    bench.add_argument('--labels', metavar='JSON',
+                       help='labelled bites as {"bites": [frame, ...]}; defaults to the reels logged in the recording')
+    bench.add_argument('--tolerance', type=int, default=3, metavar='FRAMES',
+                       help="how far a detection may be from a label and still agree (default: 3)")
+    bench.add_argument('--fps', type=float, default=30.0,
+                       help="frame rate assumed when the input has no timestamps (default: 30)")
+    bench.add_argument('--output', metavar='JSON', help="also write the full report to this file")
+    bench.add_argument('--adaptive', action='store_true',
+                       help="skip frames the adaptive poll scheduler would not have grabbed (uses --max-fps/--cpu-budget)")
+    bench.add_argument('--detect-workers', type=int, default=0, metavar='N',
+                       help="replay with N detection worker processes and compare against the in-thread detector")
+    bench.add_argument('--compare-trigger', action='store_true',
+                       help="also replay with the other --bite-trigger rule and report how much earlier or later it reels")
+    bench.add_argument('--ledger', metavar='DB', help="append the replayed session to this ledger as one run")
+    bench.add_argument('--profile', metavar='JSON',
+                       help="profile the replay (time per function, allocations per frame) and write the report here")
 
-            except Exception as e:
-                print(f"Error in macro: {e}")
-                time.sleep(1) # Sleep on error to prevent rapid error logging
+    ledger = commands.add_parser('ledger', help="summarise throughput and failure rates per run and spot")
+    ledger.add_argument('ledger', nargs='?', default=LEDGER_FILE, metavar='DB',
+                        help=f"ledger written by the macro (default: {LEDGER_FILE})")
+    ledger.add_argument('--run', type=int, metavar='ID', help="only this run")
+    ledger.add_argument('--output', metavar='JSON', help="also write the summary to this file")
+
+    calibrate = commands.add_parser('calibrate', help="pick per-template thresholds and a minimal template set from labelled frames")
+    calibrate.add_argument('recording', help="recording folder written with --record, or a .npy stack / image folder")
+    calibrate.add_argument('--labels', required=True, metavar='JSON',
+                           help='frames where each group is visible, e.g. {"bite": [120, [250, 259]], "bobber": [[5, 119]]}')
+    calibrate.add_argument('--step', type=int, default=1, metavar='N', help="score every Nth frame (default: 1)")
+    calibrate.add_argument('--output', default=CALIBRATION_FILE, metavar='JSON',
+                           help=f"where to write the calibration (default: {CALIBRATION_FILE}, which the macro loads)")
+
+    locate = commands.add_parser('locate', help="look for the fishing spot on screen and time the search")
+    locate.add_argument('image', nargs='?', help="search this screenshot, .npy stack or recording instead of the screen")
+    locate.add_argument('--scale', type=float, default=1.0, help="display scale to build the template pyramid for (default: 1.0)")
+    locate.add_argument('--repeat', type=int, default=5, help="timed searches, median reported (default: 5)")
 
-        # Clean up when stopped
-        self.root.after(0, self.stop_macro)
+    engines = commands.add_parser('engines', help="find how many templates it takes for FFT matching to beat the per-template loop")
+    engines.add_argument('--frames', metavar='PATH', help="take the test frame from a recording, .npy stack or image (default: noise)")
+    engines.add_argument('--sizes', nargs='+', default=['200x150', '400x300', '800x600'], metavar='WxH',
+                         help="region sizes to test (default: 200x150 400x300 800x600)")
+    engines.add_argument('--max-templates', type=int, default=32, metavar='N',
+                         help="largest template count to try; assets are reused to reach it (default: 32)")
+    engines.add_argument('--repeat', type=int, default=5, help="timed runs per point, median reported (default: 5)")
+    engines.add_argument('--output', metavar='JSON', help="also write the results to this file")
+    return parser.parse_args(argv)
 
 def main():
     """Main entry point for the application."""
+    multiprocessing.freeze_support() # Detection workers in the frozen executable
+    STARTUP.mark('main')
+    args = parse_args()
+    if args.command == 'benchmark':
+        run_benchmark(args)
+        return
+    if args.command == 'calibrate':
+        run_calibration(args)
+        return
+    if args.command == 'engines':
+        run_engine_benchmark(args)
+        return
+    if args.command == 'ledger':
+        run_ledger_summary(args)
+        return
+    if args.command == 'locate':
+        run_locate(args)
+        return
     try:
         root = tk.Tk()
-        app = FishingMacro(root)
+        app = FishingMacro(root, capture_backend=args.capture, frames_path=args.frames,
+                           diff_threshold=args.diff_threshold, stats_path=args.stats,
+                           record_path=args.record, match_mode=args.match_mode,
+                           prefilter=args.prefilter, detect_workers=args.detect_workers,
+                           max_fps=args.max_fps, cpu_budget=args.cpu_budget, input_backend=args.input,
+                           calibration=load_calibration(args.calibration),
+                           startup_report=args.startup_report, ledger_path=args.ledger, profile=args.profile,
+                           flight_seconds=args.flight_seconds, auto_locate=args.auto_locate,
+                           bite_trigger=args.bite_trigger, confirmations=args.confirmations)
+        STARTUP.mark('window created')
         
         # Set window position (top-right corner)
         root.update_idletasks()
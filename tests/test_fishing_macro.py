@@ -0,0 +1,138 @@
+"""Checks for the parts of the macro that run without a display or the game."""
+import os
+import threading
+
+import pytest
+
+np = pytest.importorskip('numpy')
+cv2 = pytest.importorskip('cv2')
+
+import fishing_macro as fm
+
+ASSETS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'assets')
+
+@pytest.mark.parametrize('gray', [False, True])
+def test_fft_correlator_matches_opencv(gray):
+    rng = np.random.default_rng(0)
+    image = rng.integers(0, 256, (120, 160, 3), dtype=np.uint8)
+    template = fm.Template('patch', image[40:70, 50:95].copy())
+    source = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if gray else image
+    expected = cv2.matchTemplate(source, template.gray if gray else template.image, cv2.TM_CCOEFF_NORMED)
+    result = fm.FFTCorrelator(source).match(template, gray=gray)
+    assert result.shape == expected.shape
+    assert np.abs(result - expected).max() < 1e-4
+    assert np.unravel_index(result.argmax(), result.shape) == (40, 50)
+
+def test_bite_trigger_fires_on_first_clear_frame():
+    trigger = fm.BiteTrigger(0.8, confirmations=2)
+    assert not trigger.update(0.0, 0.1, 0.9)
+    assert trigger.update(1 / 30, 0.95, 0.9)
+    # Disarmed until the score falls well below the threshold
+    assert not trigger.update(2 / 30, 0.95, 0.9)
+    assert not trigger.update(3 / 30, 0.1, 0.9)
+    assert trigger.update(4 / 30, 0.95, 0.9)
+
+def test_bite_trigger_early_band_needs_confirmations():
+    trigger = fm.BiteTrigger(0.8, confirmations=2, bobber_weight=0)
+    assert not trigger.update(0.0, 0.5, 0.9)
+    assert not trigger.update(1 / 30, 0.7, 0.9) # Rising inside the early band: first confirmation
+    assert trigger.streak == 1
+    assert trigger.update(2 / 30, 0.75, 0.9)
+
+def test_bite_trigger_early_band_without_rise_does_not_fire():
+    trigger = fm.BiteTrigger(0.8, confirmations=2, bobber_weight=0)
+    for index in range(10):
+        assert not trigger.update(index / 30, 0.7, 0.9)
+
+def test_bite_trigger_holds_confirmed_bite_until_allowed():
+    trigger = fm.BiteTrigger(0.8, confirmations=2)
+    assert not trigger.update(0.0, 0.95, 0.9, allowed=False)
+    assert trigger.confirmed
+    assert not trigger.update(1 / 30, 0.95, 0.9, allowed=False)
+    assert trigger.update(2 / 30, 0.95, 0.9, allowed=True)
+    assert not trigger.confirmed
+
+def test_frame_change_gate():
+    gate = fm.FrameChangeGate(max_skip=3)
+    frame = np.full((120, 160, 3), 80, dtype=np.uint8)
+    assert gate.changed(frame) # No reference yet
+    assert not gate.changed(frame.copy())
+    moved = frame.copy()
+    moved[40:80, 40:80] = 200
+    assert gate.changed(moved)
+    assert not gate.changed(moved)
+    assert not gate.changed(moved)
+    assert not gate.changed(moved)
+    assert gate.changed(moved) # Let through after max_skip unchanged frames
+    assert gate.skipped == 4
+
+def test_frame_change_gate_disabled():
+    gate = fm.FrameChangeGate(pixel_threshold=0)
+    frame = np.zeros((60, 80, 3), dtype=np.uint8)
+    assert gate.changed(frame) and gate.changed(frame)
+
+def test_ui_channel_keeps_latest_value_in_order():
+    channel = fm.UiChannel()
+    channel.put('status', 'casting')
+    channel.put('count', 1)
+    channel.put('status', 'watching')
+    since, changes = channel.changes()
+    assert changes == {'status': 'watching', 'count': 1}
+    assert channel.changes(since) == (since, {})
+    channel.put('count', 2)
+    since, changes = channel.changes(since)
+    assert changes == {'count': 2}
+
+def test_ui_channel_poller_never_misses_a_write():
+    channel = fm.UiChannel()
+    writes = 2000
+
+    def writer(key):
+        for value in range(writes):
+            channel.put(key, value)
+
+    threads = [threading.Thread(target=writer, args=(f'w{n}',)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    since, seen = 0, {}
+    while any(thread.is_alive() for thread in threads):
+        since, changes = channel.changes(since)
+        for key, value in changes.items():
+            assert value > seen.get(key, -1) # Never goes back
+            seen[key] = value
+    for thread in threads:
+        thread.join()
+    since, changes = channel.changes(since)
+    seen.update(changes)
+    assert seen == {f'w{n}': writes - 1 for n in range(4)}
+
+def synthetic_recording(fps=30.0, cycles=3):
+    """Water with a bobber that turns into the bite sprite for 10 frames every 120 frames."""
+    water = cv2.imread(os.path.join(ASSETS, 'water.png'))
+    bobber = cv2.imread(os.path.join(ASSETS, 'bobber2.png'))
+    bite = cv2.imread(os.path.join(ASSETS, 'capture3.PNG'))
+    height, width = 300, 400
+    rows, cols = height // water.shape[0] + 1, width // water.shape[1] + 1
+    base = np.tile(water, (rows, cols, 1))[:height, :width]
+    rng = np.random.default_rng(1)
+    frames, bites = [], []
+    for index in range(120 * cycles):
+        frame = np.clip(base.astype(np.int16) + rng.integers(-3, 4, base.shape), 0, 255).astype(np.uint8)
+        phase = index % 120
+        if 5 <= phase < 90:
+            frame[100:100 + bobber.shape[0], 150:150 + bobber.shape[1]] = bobber
+        elif 90 <= phase < 100:
+            frame[100:100 + bite.shape[0], 150:150 + bite.shape[1]] = bite
+        if phase == 90:
+            bites.append(index)
+        frames.append(frame)
+    return np.stack(frames), 1000 + np.arange(len(frames)) / fps, bites
+
+@pytest.mark.parametrize('trigger', ['temporal', 'frame'])
+def test_replay_finds_every_bite(trigger):
+    frames, timestamps, bites = synthetic_recording()
+    bank = fm.TemplateBank(ASSETS)
+    session = fm.replay_frames(frames, bank, timestamps, configs=fm.match_configs(), bite_trigger=trigger)
+    reels = [a['frame'] for a in session.actor.actions if a['event'] == 'reel']
+    true_positives, false_positives, missed, _ = fm.match_events(reels, bites, tolerance=3)
+    assert (true_positives, false_positives, missed) == (len(bites), 0, 0)